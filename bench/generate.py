@@ -0,0 +1,212 @@
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import logging
+import argparse
+import itertools
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Head of the vocabulary: common food words. The long tail is made-up words, so rare
+# tokens exist at every scale the way brand and dish names do in the real data.
+FOOD_WORDS = """
+chicken beef pork lamb turkey duck fish salmon tuna cod shrimp crab egg milk cheese butter
+yogurt cream rice bread pasta noodle bean lentil pea corn potato tomato onion garlic carrot
+pepper spinach lettuce cabbage broccoli mushroom apple banana orange lemon lime mango grape
+berry strawberry blueberry peach pear cherry coconut almond peanut walnut cashew oat wheat
+flour sugar honey chocolate vanilla cinnamon ginger curry soup salad sandwich burger pizza
+taco burrito stew sauce dressing juice tea coffee smoothie cake cookie pie muffin pancake
+waffle bar chip cracker cereal granola sausage bacon ham steak fillet breast thigh wing
+fried grilled baked roasted steamed boiled raw fresh frozen canned dried smoked spicy sweet
+sour salty crispy creamy light lowfat organic whole plain original classic homemade
+""".split()
+COUNTRIES = ["USA", "India", "Italy", "Mexico", "Japan", "France", "China", "Thailand", "Spain", "Greece",
+             "Brazil", "Germany", "Korea", "Vietnam", "Turkey", "Morocco"]
+CATEGORIES = ["Breakfast", "Lunch", "Dinner", "Dessert", "Snack", "Appetizer", "Drink", "Side Dish"]
+DIETS = ["Vegan", "Vegetarian", "Keto", "Paleo", "Gluten Free", "Low Carb", "Dairy Free", "High Protein",
+         "Low Fat", "Pescatarian"]
+SERVINGS = [("100 g", 100), ("1 cup", 240), ("1 tbsp", 15), ("1 oz", 28), ("1 piece", 50), ("1 slice", 30),
+            ("1 serving", 150)]
+NUTRIENTS = ["calories", "protein", "carbohydrates", "fat", "fiber", "sugar", "sodium", "cholesterol"]
+RECIPE_NUTRIENTS = [
+    "serving_size", "servings_per_recipe", "calories", "calories_from_fat", "total_fat", "saturated_fat",
+    "cholesterol", "sodium", "total_carbohydrates", "dietary_fiber", "sugars", "protein", "vitamin_a",
+    "vitamin_c", "calcium", "iron"
+]
+SYLLABLES = "ka lo mi ra te su no vi pa de ro la chi ba ne fu zo ma ti ke".split()
+
+
+class Vocabulary:
+    # Zipf-distributed tokens: a few words appear in a large share of names.
+    def __init__(self, rng, size, exponent=1.1):
+        words = list(FOOD_WORDS)
+        seen = set(words)
+        while len(words) < size:
+            word = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+            if word not in seen:
+                seen.add(word)
+                words.append(word)
+        self.words = words[:size]
+        self.cum_weights = list(itertools.accumulate(1 / (rank ** exponent) for rank in range(1, size + 1)))
+        self.rng = rng
+
+    def sample(self, k):
+        tokens = self.rng.choices(self.words, cum_weights=self.cum_weights, k=k)
+        return list(dict.fromkeys(tokens))
+
+
+def _connect(path):
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    return conn
+
+
+def _batched(rows, batch_size):
+    iterator = iter(rows)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def generate_food(path, rows, rng, vocabulary, batch_size=10000):
+    conn = _connect(path)
+    start = time.perf_counter()
+    try:
+        conn.execute(f"""
+            CREATE TABLE foodNutrient (
+                id INTEGER PRIMARY KEY, name TEXT, country TEXT, serving TEXT,
+                {", ".join(f"{name} REAL" for name in NUTRIENTS)}
+            )
+        """)
+        conn.execute("CREATE TABLE foodNutrient_fts (id INTEGER, nameKeys TEXT)")
+        # Most foods are USA entries, as in the source data.
+        country_weights = [40] + [60 / (len(COUNTRIES) - 1)] * (len(COUNTRIES) - 1)
+
+        def food_rows():
+            for food_id in range(1, rows + 1):
+                tokens = vocabulary.sample(rng.randint(1, 6))
+                servings = rng.sample(SERVINGS, rng.randint(1, 3))
+                serving = json.dumps([
+                    {"name": name, "weight": round(weight * rng.uniform(0.8, 1.2), 1)} for name, weight in servings
+                ]) if rng.random() < 0.95 else None
+                country = rng.choices(COUNTRIES, weights=country_weights)[0] if rng.random() < 0.97 else None
+                nutrients = [round(rng.lognormvariate(3, 1.2), 2) for _ in NUTRIENTS]
+                yield (food_id, " ".join(token.title() for token in tokens), country, serving, *nutrients), \
+                    (food_id, " ".join(tokens))
+
+        placeholders = ", ".join("?" for _ in range(4 + len(NUTRIENTS)))
+        for batch in _batched(food_rows(), batch_size):
+            conn.executemany(f"INSERT INTO foodNutrient VALUES ({placeholders})", [food for food, _ in batch])
+            conn.executemany("INSERT INTO foodNutrient_fts VALUES (?, ?)", [fts for _, fts in batch])
+        conn.commit()
+        logging.info(f"Wrote {rows} foods to '{path}' in {time.perf_counter() - start:.2f}s.")
+    finally:
+        conn.close()
+
+
+def generate_recipes(path, rows, rng, vocabulary, batch_size=5000):
+    conn = _connect(path)
+    start = time.perf_counter()
+    try:
+        conn.execute(f"""
+            CREATE TABLE recipes (
+                id INTEGER PRIMARY KEY, title TEXT, category TEXT, time INTEGER,
+                procedures TEXT, notes TEXT, dietType TEXT,
+                {", ".join(f"{name} REAL" for name in RECIPE_NUTRIENTS)},
+                ingredients TEXT, titleTags TEXT
+            )
+        """)
+        conn.execute("CREATE TABLE countries (id INTEGER PRIMARY KEY, countries TEXT)")
+        conn.execute("CREATE TABLE countries_recipes (recipe_id INTEGER, country_id INTEGER)")
+        conn.execute("CREATE TABLE ingredients (id INTEGER PRIMARY KEY, name TEXT)")
+        conn.execute("CREATE TABLE recipe_ingredients (recipe_id INTEGER, ingredient_id INTEGER)")
+        conn.execute("CREATE TABLE categories (id INTEGER PRIMARY KEY, name TEXT)")
+        conn.executemany("INSERT INTO categories VALUES (?, ?)", enumerate(DIETS, 1))
+        conn.executemany("INSERT INTO countries VALUES (?, ?)", enumerate(COUNTRIES, 1))
+        ingredient_ids = {word: i for i, word in enumerate(vocabulary.words, 1)}
+        conn.executemany("INSERT INTO ingredients VALUES (?, ?)", [(i, word) for word, i in ingredient_ids.items()])
+
+        def recipe_rows():
+            for recipe_id in range(1, rows + 1):
+                tokens = vocabulary.sample(rng.randint(1, 5))
+                ingredients = vocabulary.sample(rng.randint(3, 12))
+                steps = [f"Step {n}: {' '.join(vocabulary.sample(8))}" for n in range(1, rng.randint(2, 8))]
+                nutrients = [round(rng.lognormvariate(3.5, 1), 1) for _ in RECIPE_NUTRIENTS]
+                nutrients[RECIPE_NUTRIENTS.index("calories")] = rng.randint(50, 1500)
+                recipe = (
+                    recipe_id,
+                    " ".join(token.title() for token in tokens),
+                    rng.choice(CATEGORIES) if rng.random() < 0.95 else None,
+                    rng.choice([5, 10, 15, 20, 30, 45, 60, 90, 120]) if rng.random() < 0.9 else None,
+                    json.dumps(steps),
+                    json.dumps([" ".join(vocabulary.sample(6))] if rng.random() < 0.5 else []),
+                    json.dumps(rng.sample(DIETS, min(len(DIETS), int(rng.expovariate(0.8))))),
+                    *nutrients,
+                    json.dumps([f"{rng.randint(1, 4)} cup {word}" for word in ingredients]),
+                    " ".join(tokens)
+                )
+                countries = [(recipe_id, country_id) for country_id in
+                             rng.sample(range(1, len(COUNTRIES) + 1), rng.choice([0, 1, 1, 1, 2]))]
+                links = [(recipe_id, ingredient_ids[word]) for word in ingredients]
+                yield recipe, countries, links
+
+        placeholders = ", ".join("?" for _ in range(9 + len(RECIPE_NUTRIENTS)))
+        for batch in _batched(recipe_rows(), batch_size):
+            conn.executemany(f"INSERT INTO recipes VALUES ({placeholders})", [recipe for recipe, _, _ in batch])
+            conn.executemany("INSERT INTO countries_recipes VALUES (?, ?)",
+                             [row for _, countries, _ in batch for row in countries])
+            conn.executemany("INSERT INTO recipe_ingredients VALUES (?, ?)",
+                             [row for _, _, links in batch for row in links])
+        conn.commit()
+        logging.info(f"Wrote {rows} recipes to '{path}' in {time.perf_counter() - start:.2f}s.")
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic food and recipe DBs for benchmarking.")
+    parser.add_argument('--out', default='bench_data', help="Directory for food.db and recipe.db")
+    parser.add_argument('--food-rows', type=int, default=100000)
+    parser.add_argument('--recipe-rows', type=int, default=20000)
+    parser.add_argument('--vocabulary', type=int, default=None,
+                        help="Distinct tokens (default grows with the row count)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--build', action='store_true',
+                        help="Also run the src.migrations build steps on the generated files")
+    args = parser.parse_args(argv)
+
+    if not 1 <= args.food_rows <= 10_000_000 or not 1 <= args.recipe_rows <= 10_000_000:
+        logging.error("Row counts must be between 1 and 10,000,000.")
+        sys.exit(1)
+
+    os.makedirs(args.out, exist_ok=True)
+    food_path = os.path.join(args.out, 'food.db')
+    recipe_path = os.path.join(args.out, 'recipe.db')
+    size = args.vocabulary or max(len(FOOD_WORDS), int(max(args.food_rows, args.recipe_rows) ** 0.6))
+
+    rng = random.Random(args.seed)
+    vocabulary = Vocabulary(rng, size)
+    generate_food(food_path, args.food_rows, rng, vocabulary)
+    generate_recipes(recipe_path, args.recipe_rows, rng, vocabulary)
+
+    if args.build:
+        from src import migrations
+        migrations.build_food_fts(food_path)
+        migrations.build_food_rank(food_path, os.getenv('FOOD_PREFERRED_COUNTRY', 'USA'))
+        migrations.build_recipe_indexes(recipe_path)
+        migrations.build_recipe_docs(recipe_path)
+
+    print(f"FOOD_NUTRITION_FILE_KEY={food_path}")
+    print(f"RECIPE_FILE_KEY={recipe_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import sqlite3
+import logging
+import argparse
+import platform
+import contextlib
+import resource
+import subprocess
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class Samples:
+    # Request inputs drawn from the DBs being served, so queries hit real tokens and ids.
+    def __init__(self, food_db, recipe_db, rng, size=500):
+        self.rng = rng
+        with contextlib.closing(sqlite3.connect(f"file:{food_db}?mode=ro", uri=True)) as conn:
+            self.food_names = self._random_column(conn, "foodNutrient", "name", size)
+            self.food_ids = self._random_column(conn, "foodNutrient", "id", size)
+        with contextlib.closing(sqlite3.connect(f"file:{recipe_db}?mode=ro", uri=True)) as conn:
+            self.recipe_titles = self._random_column(conn, "recipes", "title", size)
+            self.recipe_ids = self._random_column(conn, "recipes", "id", size)
+            self.ingredients = self._random_column(conn, "ingredients", "name", size)
+            self.categories = [row[0] for row in conn.execute(
+                "SELECT DISTINCT category FROM recipes WHERE category IS NOT NULL")]
+            self.countries = [row[0] for row in conn.execute("SELECT countries FROM countries")]
+            self.diets = [row[0] for row in conn.execute("SELECT name FROM categories")]
+
+    def _random_column(self, conn, table, column, size):
+        # Random ids rather than ORDER BY random(), which would scan a 10M row table.
+        low, high = conn.execute(f"SELECT MIN(id), MAX(id) FROM {table}").fetchone()
+        ids = [self.rng.randint(low, high) for _ in range(size)]
+        placeholders = ",".join("?" for _ in ids)
+        values = [row[0] for row in conn.execute(
+            f"SELECT {column} FROM {table} WHERE id IN ({placeholders}) AND {column} IS NOT NULL", ids)]
+        return values or [None]
+
+    def words(self, values, most=2):
+        words = str(self.rng.choice(values) or "").split()
+        return " ".join(self.rng.sample(words, min(len(words), self.rng.randint(1, most)))) or "a"
+
+
+def _recipe_filters(samples, rng):
+    params = {"results_per_page": 10}
+    if rng.random() < 0.5:
+        params["query"] = samples.words(samples.recipe_titles)
+    if rng.random() < 0.3 and samples.categories:
+        params["category"] = rng.choice(samples.categories)
+    if rng.random() < 0.3 and samples.countries:
+        params["country"] = rng.choice(samples.countries)
+    if rng.random() < 0.3 and samples.diets:
+        params["dietType"] = rng.choice(samples.diets)
+    if rng.random() < 0.3:
+        params["calories_max"] = rng.choice([300, 500, 800])
+    if rng.random() < 0.2:
+        params["time_max"] = rng.choice([15, 30, 60])
+    if rng.random() < 0.3:
+        params["page"] = rng.randint(2, 5)
+    return params
+
+
+# name -> builder returning (method, path, query params, JSON body) for one request.
+SCENARIOS = {
+    "health": lambda s, rng: ("GET", "/health", {}, None),
+    "stats": lambda s, rng: ("GET", "/stats", {}, None),
+    "metrics": lambda s, rng: ("GET", "/metrics", {}, None),
+    "search_food_paging": lambda s, rng: ("GET", "/search_food_paging", {
+        "food_name": s.words(s.food_names), "results_per_page": 10, "page": rng.choice([1, 1, 1, 2, 3])
+    }, None),
+    "food_suggest": lambda s, rng: ("GET", "/food_suggest", {"q": s.words(s.food_names)[:rng.randint(2, 6)], "limit": 10}, None),
+    "meal_nutrition": lambda s, rng: ("POST", "/meal_nutrition", {}, {"items": [
+        {"id": rng.choice(s.food_ids), "serving": rng.randint(0, 1), "quantity": rng.choice([0.5, 1, 2])}
+        for _ in range(rng.randint(1, 200))
+    ]}),
+    "recipe_filters": lambda s, rng: ("GET", "/recipe_filters", {}, None),
+    "diet_recommendations": lambda s, rng: ("GET", "/diet_recommendations", {"limit": 10}, None),
+    "recipes_filter_paginated": lambda s, rng: ("GET", "/recipes_filter_paginated", _recipe_filters(s, rng), None),
+    "recipes_by_ingredients": lambda s, rng: ("GET", "/recipes_by_ingredients", {
+        **{k: v for k, v in _recipe_filters(s, rng).items() if k != "query"},
+        "ingredient": rng.sample(s.ingredients, min(len(s.ingredients), rng.randint(3, 10))),
+        "max_missing": rng.choice([0, 1, 2])
+    }, None),
+    "recipes": lambda s, rng: ("GET", f"/recipes/{rng.choice(s.recipe_ids)}", {}, None),
+    "recipes_batch": lambda s, rng: ("POST", "/recipes/batch", {}, {"ids": rng.sample(s.recipe_ids, min(20, len(s.recipe_ids)))}),
+}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(scenario, concurrency, latencies, statuses, elapsed):
+    latencies = sorted(latencies)
+    errors = sum(count for status, count in statuses.items() if status is None or int(status) >= 500)
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": {str(status): count for status, count in statuses.items()},
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None
+    }
+
+
+async def asgi_request(app, method, path, params, body):
+    # One HTTP request straight through the ASGI app, with no socket or client library.
+    query = urllib.parse.urlencode(params, doseq=True).encode()
+    payload = json.dumps(body).encode() if body is not None else b""
+    headers = [(b"host", b"bench")]
+    if body is not None:
+        headers += [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())]
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query,
+        "root_path": "", "headers": headers, "client": ("127.0.0.1", 0), "server": ("bench", 80)
+    }
+    messages = [{"type": "http.request", "body": payload, "more_body": False}]
+    status = None
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def run_in_process(app, requests, concurrency):
+    latencies = []
+    statuses = {}
+    queue = list(requests)
+
+    async def worker():
+        while queue:
+            method, path, params, body = queue.pop()
+            start = time.perf_counter()
+            try:
+                status = await asgi_request(app, method, path, params, body)
+            except Exception:
+                status = None
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - start
+
+
+def http_request(base_url, method, path, params, body, timeout):
+    url = base_url.rstrip("/") + path
+    if params:
+        url += "?" + urllib.parse.urlencode(params, doseq=True)
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(url, data=data, method=method)
+    if data is not None:
+        request.add_header("Content-Type", "application/json")
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        return e.code
+
+
+def run_over_http(base_url, requests, concurrency, timeout):
+    def timed(request):
+        start = time.perf_counter()
+        try:
+            status = http_request(base_url, *request, timeout)
+        except Exception:
+            status = None
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(timed, requests))
+    elapsed = time.perf_counter() - start
+
+    statuses = {}
+    for _, status in outcomes:
+        statuses[status] = statuses.get(status, 0) + 1
+    return [latency for latency, _ in outcomes], statuses, elapsed
+
+
+def peak_rss_kib(server_pids):
+    # ru_maxrss is KiB on Linux; server processes report their high-water mark in /proc.
+    if not server_pids:
+        return {"self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+    peaks = {}
+    for pid in server_pids:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        peaks[str(pid)] = int(line.split()[1])
+        except OSError:
+            peaks[str(pid)] = None
+    return peaks
+
+
+def compare(results, baseline, threshold):
+    # Regressions: p95 up or throughput down by more than `threshold` against the baseline.
+    previous = {(row["scenario"], row["concurrency"]): row for row in baseline.get("results", [])}
+    regressions = []
+    print(f"{'scenario':<28}{'conc':>6}{'p95 ms':>12}{'base':>12}{'Δ%':>9}{'rps':>12}{'base':>12}{'Δ%':>9}")
+    for row in results:
+        base = previous.get((row["scenario"], row["concurrency"]))
+        if not base or not base.get("p95_ms") or not base.get("throughput_rps") or row["p95_ms"] is None:
+            continue
+        p95_delta = row["p95_ms"] / base["p95_ms"] - 1
+        rps_delta = row["throughput_rps"] / base["throughput_rps"] - 1
+        flag = p95_delta > threshold or rps_delta < -threshold
+        if flag:
+            regressions.append((row["scenario"], row["concurrency"]))
+        print(f"{row['scenario']:<28}{row['concurrency']:>6}{row['p95_ms']:>12.2f}{base['p95_ms']:>12.2f}"
+              f"{p95_delta * 100:>8.1f}%{row['throughput_rps']:>12.1f}{base['throughput_rps']:>12.1f}"
+              f"{rps_delta * 100:>8.1f}%{'  REGRESSION' if flag else ''}")
+    return regressions
+
+
+FILTER_PARAMS = ("category", "country", "dietType", "calories_min", "calories_max", "time_min", "time_max")
+
+
+def _walk(handler, scenario, params, pages):
+    # The sampled page and the pages after it reached through next_cursor, straight from the handler.
+    filters = {name: params[name] for name in FILTER_PARAMS if name in params}
+    if scenario == "recipes_by_ingredients":
+        def search(**kwargs):
+            return handler.search_by_ingredients(ingredients=params["ingredient"], max_missing=params["max_missing"],
+                                                 filters=filters, results_per_page=params["results_per_page"], **kwargs)
+    else:
+        def search(**kwargs):
+            return handler.search(query=params.get("query"), filters=filters,
+                                  results_per_page=params["results_per_page"], **kwargs)
+
+    responses = [search(page=params.get("page", 1))]
+    while len(responses) < pages and responses[-1] and responses[-1].get("next_cursor"):
+        responses.append(search(cursor=responses[-1]["next_cursor"]))
+    return responses
+
+
+def verify_engines(recipe_db, samples, rng, count, pages=3):
+    # Runs sampled recipe searches through RECIPE_FILTER_ENGINE=sql and =columnar and
+    # returns the (scenario, params) whose responses differ. The result cache is off so
+    # each engine computes its own answer.
+    os.environ['QUERY_CACHE_ENABLED'] = '0'
+    from src.dbHelper import RecipeDatabaseHandler
+    handlers = {}
+    for engine in ('sql', 'columnar'):
+        os.environ['RECIPE_FILTER_ENGINE'] = engine
+        handlers[engine] = RecipeDatabaseHandler(recipe_db)
+    if handlers['columnar'].recipe_columns() is None:
+        raise RuntimeError("The columnar filter engine needs numpy")
+
+    mismatches = []
+    for n in range(count):
+        scenario = ("recipes_filter_paginated", "recipes_by_ingredients")[n % 2]
+        _, _, params, _ = SCENARIOS[scenario](samples, rng)
+        expected = _walk(handlers['sql'], scenario, params, pages)
+        if _walk(handlers['columnar'], scenario, params, pages) != expected:
+            mismatches.append((scenario, params))
+            logging.error(f"Engines disagree on {scenario} {json.dumps(params)}")
+    for handler in handlers.values():
+        handler.pool.close()
+    logging.info(f"Compared {count} recipe searches across filter engines: {len(mismatches)} mismatches.")
+    return mismatches
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-benchmark every endpoint in-process or over HTTP.")
+    parser.add_argument('--mode', choices=['inprocess', 'http'], default='inprocess')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help="Server for --mode http")
+    parser.add_argument('--food-db', default=os.getenv('FOOD_NUTRITION_FILE_KEY', 'bench_data/food.db'))
+    parser.add_argument('--recipe-db', default=os.getenv('RECIPE_FILE_KEY', 'bench_data/recipe.db'))
+    parser.add_argument('--scenarios', nargs='*', default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, nargs='*', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=500, help="Measured requests per scenario and level")
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-result-cache', action='store_true',
+                        help="Disable the shared query result cache (in-process only)")
+    parser.add_argument('--server-pid', type=int, nargs='*', default=[],
+                        help="Server process ids whose peak RSS to report in --mode http")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    parser.add_argument('--baseline', help="Compare against a previous --output file")
+    parser.add_argument('--threshold', type=float, default=0.10)
+    parser.add_argument('--verify', type=int, metavar='N',
+                        help="Instead of benchmarking, check N sampled recipe searches give identical "
+                             "results with the sql and columnar filter engines")
+    args = parser.parse_args(argv)
+
+    for path in (args.food_db, args.recipe_db):
+        if not os.path.exists(path):
+            logging.error(f"Database file '{path}' does not exist; run `python -m bench.generate` first.")
+            sys.exit(1)
+
+    rng = random.Random(args.seed)
+    samples = Samples(args.food_db, args.recipe_db, rng)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    if args.verify:
+        if verify_engines(args.recipe_db, samples, rng, args.verify):
+            sys.exit(1)
+        return
+
+    if args.mode == 'inprocess':
+        os.environ['FOOD_NUTRITION_FILE_KEY'] = args.food_db
+        os.environ['RECIPE_FILE_KEY'] = args.recipe_db
+        if args.no_result_cache:
+            os.environ['QUERY_CACHE_ENABLED'] = '0'
+        import main as service
+        loop = asyncio.new_event_loop()
+
+        def execute(requests, concurrency):
+            return loop.run_until_complete(run_in_process(service.app, requests, concurrency))
+    else:
+        def execute(requests, concurrency):
+            return run_over_http(args.url, requests, concurrency, args.timeout)
+
+    results = []
+    for scenario in args.scenarios:
+        build = SCENARIOS[scenario]
+        execute([build(samples, rng) for _ in range(args.warmup)], max(args.concurrency))
+        for concurrency in args.concurrency:
+            requests = [build(samples, rng) for _ in range(args.requests)]
+            row = summarize(scenario, concurrency, *execute(requests, concurrency))
+            results.append(row)
+            logging.info(
+                f"{scenario} c={concurrency}: p50 {row['p50_ms']}ms p95 {row['p95_ms']}ms "
+                f"p99 {row['p99_ms']}ms {row['throughput_rps']} req/s, {row['errors']} errors"
+            )
+
+    report = {
+        "meta": {
+            "mode": args.mode,
+            "url": args.url if args.mode == 'http' else None,
+            "food_db": args.food_db,
+            "recipe_db": args.recipe_db,
+            "requests": args.requests,
+            "seed": args.seed,
+            "result_cache": not args.no_result_cache if args.mode == 'inprocess' else None,
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "timestamp": time.time()
+        },
+        "peak_rss_kib": peak_rss_kib(args.server_pid if args.mode == 'http' else []),
+        "results": results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        logging.info(f"Wrote results to '{args.output}'.")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            logging.error(f"{len(regressions)} regressions beyond {args.threshold:.0%}.")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,143 @@
-from typing import Optional
-from fastapi import FastAPI, HTTPException, Query
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from pydantic import BaseModel, Field
 
 import os
+import hmac
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 food_nutrition_file_path = os.getenv('FOOD_NUTRITION_FILE_KEY')
 recipe_file_path = os.getenv('RECIPE_FILE_KEY')
+recipe_batch_max = int(os.getenv('RECIPE_BATCH_MAX', '50'))
+meal_items_max = int(os.getenv('MEAL_ITEMS_MAX', '500'))
+pantry_max_ingredients = int(os.getenv('PANTRY_MAX_INGREDIENTS', '100'))
+admin_token = os.getenv('ADMIN_TOKEN')
 
-app = FastAPI()
+def log_task_failure(task):
+    if not task.cancelled() and task.exception() is not None:
+        logging.error(f"Background task {task.get_name()} failed.", exc_info=task.exception())
+
+@asynccontextmanager
+async def lifespan(app):
+    db_versions.start()
+    # Built on the DB executor so startup isn't blocked; its size and build time are logged.
+    app.state.suggest_index_task = asyncio.create_task(
+        db_executor.run("food_suggest_index", db_handler_food.suggest_index), name="build_suggest_index"
+    )
+    app.state.suggest_index_task.add_done_callback(log_task_failure)
+    yield
+    db_versions.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 from src.dbHelper import FoodDatabaseHandler, RecipeDatabaseHandler
+from src.pagination import InvalidCursor
+from src.executor import DBExecutor, Overloaded
+from src.db_versions import DBVersionManager
+from src.metrics import METRICS
+from src.prefork import worker_stats
 
 db_handler_food = FoodDatabaseHandler()
 db_handler_recipe = RecipeDatabaseHandler()
+db_executor = DBExecutor()
+db_versions = DBVersionManager({"food": db_handler_food, "recipe": db_handler_recipe})
 
 def return_format(data):
     status = True
     message = "Success"
     return {"status_code": status, "message": message, "response": data}
 
+def return_raw(document):
+    # return_format() around an already-serialized JSON document, without re-encoding it.
+    return Response(
+        content=b'{"status_code":true,"message":"Success","response":' + document + b'}',
+        media_type="application/json"
+    )
+
 @app.get("/health")
 async def health_check():
-    return {"status": "ok"}
+    return {"status": "ok", "db_versions": db_versions.status()}
+
+class DBReloadRequest(BaseModel):
+    name: str
+    path: Optional[str] = None
+
+@app.post("/admin/reload_db")
+async def reload_db(body: DBReloadRequest, request: Request):
+    # Disabled unless ADMIN_TOKEN is set; the caller must send it as X-Admin-Token.
+    supplied = request.headers.get("x-admin-token", "").encode()
+    if not admin_token or not hmac.compare_digest(supplied, admin_token.encode()):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if body.name not in db_versions.handlers:
+        raise HTTPException(status_code=400, detail=f"Unknown database '{body.name}'")
+    try:
+        version = await db_executor.run("admin_reload_db", db_versions.request, body.name, body.path)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return return_format({"name": body.name, "version": version, "db_versions": db_versions.status()})
+
+def result_cache_stats():
+    return {
+        "food": db_handler_food.result_cache.stats(),
+        "recipe": db_handler_recipe.result_cache.stats()
+    }
+
+@app.get("/stats")
+async def stats():
+    # The result cache stats query a file shared with every worker, so they run off the event loop.
+    result_cache = await db_executor.run("stats", result_cache_stats)
+    return return_format({
+        "pools": {
+            "food": db_handler_food.pool.stats(),
+            "recipe": db_handler_recipe.pool.stats()
+        },
+        "count_cache": {
+            "food": db_handler_food.count_cache.stats(),
+            "recipe": db_handler_recipe.count_cache.stats()
+        },
+        "executor": db_executor.stats(),
+        "result_cache": result_cache,
+        "recipe_doc_cache": db_handler_recipe.doc_cache.stats(),
+        "search_flight": {
+            "food": db_handler_food.search_flight.stats(),
+            "recipe": db_handler_recipe.search_flight.stats()
+        },
+        "worker": worker_stats(),
+        "food_suggest_index": db_handler_food._suggest_index.stats() if db_handler_food._suggest_index else None
+    })
+
+@app.get("/metrics")
+async def metrics():
+    # Prometheus scrape target; merges the snapshots of every worker on the host.
+    content = await db_executor.run("metrics", METRICS.render)
+    return Response(content=content, media_type="text/plain; version=0.0.4")
 
 @app.get("/search_food_paging")
 async def search_food_paging(
     food_name: str = Query(..., alias="food_name"),
     page: int = Query(1, ge=1),
-    results_per_page: int = Query(10, ge=1)):
+    results_per_page: int = Query(10, ge=1),
+    cursor: Optional[str] = Query(None, description="Opaque next_cursor from a previous page; overrides page"),
+    include_total: bool = Query(True, description="Set to false to skip counting total_rows")):
     try:
-        result = db_handler_food.search(
+        result = await db_executor.run(
+            "search_food_paging",
+            db_handler_food.search,
             query=food_name,
             page=page,
-            results_per_page=results_per_page
+            results_per_page=results_per_page,
+            cursor=cursor,
+            include_total=include_total
         )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
@@ -39,23 +145,80 @@ async def search_food_paging(
         raise HTTPException(status_code=404, detail="No results found")
     return return_format(result)
 
+@app.get("/food_suggest")
+async def food_suggest(
+    q: str = Query(..., min_length=1, description="Partial food name; every word matches a word prefix"),
+    limit: int = Query(10, ge=1, le=50)):
+    try:
+        suggestions = await db_executor.run("food_suggest", db_handler_food.suggest, q, limit)
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return return_format(suggestions)
+
+class MealItem(BaseModel):
+    id: int
+    serving: int = Field(0, ge=0, description="Index into the food's serving list")
+    quantity: float = Field(1.0, gt=0)
+
+class MealNutritionRequest(BaseModel):
+    items: List[MealItem]
+
+@app.post("/meal_nutrition")
+async def meal_nutrition(body: MealNutritionRequest):
+    if not body.items:
+        raise HTTPException(status_code=400, detail="No meal items given")
+    if len(body.items) > meal_items_max:
+        raise HTTPException(status_code=400, detail=f"At most {meal_items_max} meal items per request")
+    items = [(item.id, item.serving, item.quantity) for item in body.items]
+    try:
+        meal = await db_executor.run("meal_nutrition", db_handler_food.meal_nutrition, items)
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if meal is None:
+        raise HTTPException(status_code=500, detail="Error computing meal nutrition")
+    return return_format(meal)
+
+def etag_matches(request, etag):
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
 @app.get("/recipe_filters")
-async def get_all_filters():
+async def get_all_filters(request: Request, response: Response):
+    version = db_handler_recipe.db_version()
+    etag = f'"{version}"' if version else None
+    if etag and etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
     try:
-        filters = db_handler_recipe.get_all_filters()
+        filters = await db_executor.run("recipe_filters", db_handler_recipe.get_all_filters)
         if not filters:
             raise HTTPException(status_code=404, detail="No filters found")
+        if etag:
+            response.headers["ETag"] = etag
         return return_format(filters)
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting filters: {str(e)}")
 
 @app.get("/diet_recommendations")
 async def get_diet_recommendations(limit: int = Query(10, description="Maximum number of recipes per diet type")):
     try:
-        recommendations = db_handler_recipe.group_recipes_by_diet(limit=limit)
+        recommendations = await db_executor.run(
+            "diet_recommendations", db_handler_recipe.group_recipes_by_diet, limit=limit
+        )
         if not recommendations:
             raise HTTPException(status_code=404, detail="No recommendations found")
         return return_format(recommendations)
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -70,20 +233,32 @@ async def recipes_filter_paginated(
     time_min: Optional[int] = Query(None, ge=0, description="Minimum cooking time in minutes"),
     time_max: Optional[int] = Query(None, ge=0, description="Maximum cooking time in minutes"),
     page: int = Query(1, ge=1, description="Page number (min 1)"),
-    results_per_page: int = Query(10, ge=1, le=100, description="Results per page (1-100)")
+    results_per_page: int = Query(10, ge=1, le=100, description="Results per page (1-100)"),
+    cursor: Optional[str] = Query(None, description="Opaque next_cursor from a previous page; overrides page"),
+    include_total: bool = Query(True, description="Set to false to skip counting total_rows"),
+    facets: bool = Query(False, description="Include per-facet result counts (columnar filter engine only)")
 ):
     filters = {
         k: v for k, v in locals().items() 
-        if k not in ["query", "page", "results_per_page"] and v is not None
+        if k not in ["query", "page", "results_per_page", "cursor", "include_total", "facets"] and v is not None
     }
     
     try:
-        result = db_handler_recipe.search(
+        result = await db_executor.run(
+            "recipes_filter_paginated",
+            db_handler_recipe.search,
             query=query,
             filters=filters,
             page=page,
-            results_per_page=results_per_page
+            results_per_page=results_per_page,
+            cursor=cursor,
+            include_total=include_total,
+            facets=facets
         )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
@@ -91,16 +266,99 @@ async def recipes_filter_paginated(
         raise HTTPException(status_code=404, detail="No recipes found matching the criteria")
     return return_format(result)
 
+@app.get("/recipes_by_ingredients")
+async def recipes_by_ingredients(
+    ingredient: Optional[List[str]] = Query(None, description="Ingredient names in the pantry, e.g. ?ingredient=egg&ingredient=milk"),
+    ingredient_id: Optional[List[int]] = Query(None, description="Ingredient ids in the pantry"),
+    max_missing: int = Query(0, ge=0, le=20, description="Recipes may need at most this many other ingredients"),
+    category: Optional[str] = Query(None, description="Filter by recipe category"),
+    country: Optional[str] = Query(None, description="Filter by country of origin"),
+    dietType: Optional[str] = Query(None, description="Filter by diet type"),
+    calories_min: Optional[int] = Query(None, ge=0, description="Minimum calorie count"),
+    calories_max: Optional[int] = Query(None, ge=0, description="Maximum calorie count"),
+    time_min: Optional[int] = Query(None, ge=0, description="Minimum cooking time in minutes"),
+    time_max: Optional[int] = Query(None, ge=0, description="Maximum cooking time in minutes"),
+    page: int = Query(1, ge=1, description="Page number (min 1)"),
+    results_per_page: int = Query(10, ge=1, le=100, description="Results per page (1-100)"),
+    cursor: Optional[str] = Query(None, description="Opaque next_cursor from a previous page; overrides page"),
+    include_total: bool = Query(True, description="Set to false to skip counting total_rows")
+):
+    ingredient = ingredient or []
+    ingredient_id = ingredient_id or []
+    if not ingredient and not ingredient_id:
+        raise HTTPException(status_code=400, detail="No ingredients given")
+    if len(ingredient) + len(ingredient_id) > pantry_max_ingredients:
+        raise HTTPException(status_code=400, detail=f"At most {pantry_max_ingredients} ingredients per search")
+    filters = {
+        k: v for k, v in (("category", category), ("country", country), ("dietType", dietType),
+                          ("calories_min", calories_min), ("calories_max", calories_max),
+                          ("time_min", time_min), ("time_max", time_max))
+        if v is not None
+    }
+
+    try:
+        result = await db_executor.run(
+            "recipes_by_ingredients",
+            db_handler_recipe.search_by_ingredients,
+            ingredients=ingredient,
+            ingredient_ids=ingredient_id,
+            max_missing=max_missing,
+            filters=filters,
+            page=page,
+            results_per_page=results_per_page,
+            cursor=cursor,
+            include_total=include_total
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if not result:
+        raise HTTPException(status_code=404, detail="No recipes found for these ingredients")
+    return return_format(result)
+
+class RecipeBatchRequest(BaseModel):
+    ids: List[int]
+
+async def fetch_recipe_batch(ids):
+    if not ids:
+        raise HTTPException(status_code=400, detail="No recipe ids given")
+    if len(ids) > recipe_batch_max:
+        raise HTTPException(status_code=400, detail=f"At most {recipe_batch_max} recipe ids per batch")
+    try:
+        batch = await db_executor.run("recipes_batch", db_handler_recipe.get_recipes_by_ids, ids)
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if batch is None:
+        raise HTTPException(status_code=500, detail="Error fetching recipes")
+    return return_format(batch)
+
+@app.post("/recipes/batch")
+async def get_recipes_batch(body: RecipeBatchRequest):
+    return await fetch_recipe_batch(body.ids)
+
+@app.get("/recipes/batch")
+async def get_recipes_batch_query(ids: List[int] = Query(..., description="Recipe ids, e.g. ?ids=1&ids=2")):
+    return await fetch_recipe_batch(ids)
+
 @app.get("/recipes/{recipe_id}")
 async def get_recipe(recipe_id: int):
     try:
-        recipe = db_handler_recipe.get_recipe_by_id(recipe_id)
+        document = await db_executor.run("recipes", db_handler_recipe.get_recipe_doc, recipe_id)
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
-    if not recipe:
+    if not document:
         raise HTTPException(status_code=404, detail=f"Recipe with ID {recipe_id} not found")
-    return return_format(recipe)
+    return return_raw(document)
 
 if __name__ == '__main__':
     import uvicorn
@@ -117,4 +375,14 @@ if __name__ == '__main__':
     else:
         print("Both files already exist. No download needed.")
 
-    uvicorn.run("main:app", host='0.0.0.0', port=5000, workers=4, limit_max_requests=200)
+    if os.getenv('PREFORK', '1') == '1':
+        # uvicorn spawns its workers, so each recycled one would start cold; fork them from a warm parent instead.
+        from src.prefork import Supervisor, warm_up
+        Supervisor(
+            app,
+            warm=lambda: warm_up(db_handler_food, db_handler_recipe),
+            host='0.0.0.0', port=5000, workers=4, limit_max_requests=200,
+            db_versions=db_versions
+        ).run()
+    else:
+        uvicorn.run("main:app", host='0.0.0.0', port=5000, workers=4, limit_max_requests=200)
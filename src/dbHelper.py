@@ -2,6 +2,27 @@ import string
 import sqlite3
 import os
 import json
+import logging
+import threading
+from bisect import bisect_right
+
+from src.db_pool import ConnectionPool
+from src.db_versions import VersionedHandler
+from src.food_suggest import SuggestIndex
+from src.lru import LRUCache
+from src.metrics import instrument, note_tokens
+from src.query_builder import RecipeQueryBuilder
+from src.recipe_columns import RecipeColumns, np
+from src.pantry_index import PantryIndex
+from src.pagination import CountCache, InvalidCursor, cache_key, decode_cursor, encode_cursor
+from src.result_cache import ResultCache
+from src.singleflight import SingleFlight
+from src.title_index import TitleIndex
+
+FOOD_FTS_TABLE = "foodNutrient_fts5"
+FOOD_META_TABLE = "food_search_meta"
+FOOD_RANK_INDEX = "idx_food_search_rank"
+RECIPE_DOCS_TABLE = "recipe_docs"
 
 def clean_query(query):
     query = query.lower()
@@ -9,59 +30,390 @@ def clean_query(query):
     words = query.split()
     cleaned_words = [word[:-1] if word.endswith('s') and len(word) > 1 else word for word in words]
     cleaned_words = list(set(cleaned_words))  
+    note_tokens(cleaned_words)
     return cleaned_words
 
-class FoodDatabaseHandler:
-    def __init__(self):
-        self.db_path = os.getenv('FOOD_NUTRITION_FILE_KEY')
-    
-    def search(self, query, page=1, results_per_page=100):
-        cleaned_words = clean_query(query)
-        if not cleaned_words:
-            return None
+RECIPE_DETAIL_SQL = """
+    SELECT 
+        r.id, r.title, r.category, r.time,
+        r.procedures, r.notes, r.dietType,
+        r.serving_size, r.servings_per_recipe,
+        r.calories, r.calories_from_fat,
+        r.total_fat, r.saturated_fat,
+        r.cholesterol, r.sodium,
+        r.total_carbohydrates, r.dietary_fiber,
+        r.sugars, r.protein,
+        r.vitamin_a, r.vitamin_c,
+        r.calcium, r.iron,
+        r.ingredients, r.titleTags,
+        GROUP_CONCAT(DISTINCT c.countries) AS countries,
+        GROUP_CONCAT(DISTINCT i.name) AS ingredients_list
+    FROM recipes r
+    LEFT JOIN countries_recipes cr ON r.id = cr.recipe_id
+    LEFT JOIN countries c ON cr.country_id = c.id
+    LEFT JOIN recipe_ingredients ri ON r.id = ri.recipe_id
+    LEFT JOIN ingredients i ON ri.ingredient_id = i.id
+    WHERE {where}
+    GROUP BY r.id
+"""
+
+# procedures, notes, dietType and ingredients columns of a RECIPE_DETAIL_SQL row.
+RECIPE_JSON_COLUMNS = (4, 5, 6, 23)
+
+def _decode_recipe_json(row):
+    return [json.loads(row[i]) if row[i] else [] for i in RECIPE_JSON_COLUMNS]
 
+def _bulk_decode_recipe_json(rows):
+    # Decodes every JSON column of every row with a single json.loads call; if any
+    # value is malformed, falls back to per-row decoding so only that row is lost.
+    try:
+        flat = json.loads("[" + ",".join(row[i] or "[]" for row in rows for i in RECIPE_JSON_COLUMNS) + "]")
+        if len(flat) == len(rows) * len(RECIPE_JSON_COLUMNS):
+            width = len(RECIPE_JSON_COLUMNS)
+            return [flat[n * width:(n + 1) * width] for n in range(len(rows))]
+    except json.JSONDecodeError:
+        pass
+    decoded = []
+    for row in rows:
+        try:
+            decoded.append(_decode_recipe_json(row))
+        except json.JSONDecodeError as e:
+            print(f"JSON parsing error for recipe {row[0]}: {e}")
+            decoded.append(None)
+    return decoded
+
+def serialize_recipe(recipe):
+    # The exact bytes Starlette's JSONResponse renders for this dict.
+    return json.dumps(recipe, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def format_recipe_row(row, decoded=None):
+    procedures, notes, dietType, ingredients = decoded or _decode_recipe_json(row)
+    countries = row[25].split(',') if row[25] else []
+
+    return {
+        "id": row[0],
+        "title": row[1],
+        "category": row[2],
+        "time": row[3],
+        "procedures": procedures,
+        "notes": notes,
+        "dietType": dietType,  
+        "serving_size": row[7],
+        "servings_per_recipe": row[8],
+        "calories": row[9],
+        "calories_from_fat": row[10],
+        "total_fat": row[11],
+        "saturated_fat": row[12],
+        "cholesterol": row[13],
+        "sodium": row[14],
+        "total_carbohydrates": row[15],
+        "dietary_fiber": row[16],
+        "sugars": row[17],
+        "protein": row[18],
+        "vitamin_a": row[19],
+        "vitamin_c": row[20],
+        "calcium": row[21],
+        "iron": row[22],
+        "ingredients": ingredients,
+        "countries": countries,
+        "ingredients_list": row[26],
+        "image_url": "https://api.quantumgrove.tech:8001/calosync/xxhdpi/fi_alcohol.png"
+    }
+
+def _bulk_decode_servings(rows, column):
+    # Same single json.loads approach as _bulk_decode_recipe_json; a malformed value only loses its row.
+    try:
+        decoded = json.loads("[" + ",".join(row[column] or "null" for row in rows) + "]")
+        if len(decoded) == len(rows):
+            return decoded
+    except json.JSONDecodeError:
+        pass
+    servings = []
+    for row in rows:
+        try:
+            servings.append(json.loads(row[column]) if row[column] else None)
+        except json.JSONDecodeError as e:
+            print(f"JSON parsing error for food {row[0]}: {e}")
+            servings.append(None)
+    return servings
+
+def _scale_nutrients(values, factors):
+    # Per-item nutrients (values[i] * factors[i]) and their column totals; NULLs are
+    # None per item and left out of the totals.
+    if np is not None:
+        width = len(values[0]) if values else 0
+        scaled = np.array(values, dtype=float).reshape(len(values), width) * np.array(factors)[:, None]
+        totals = np.nansum(scaled, axis=0).tolist()
+        items = [[None if value != value else value for value in row] for row in scaled.tolist()]
+        return items, totals
+    items = [[None if value is None else value * factor for value in row] for row, factor in zip(values, factors)]
+    totals = [sum(value for value in column if value is not None) for column in zip(*items)] if items else []
+    return items, totals
+
+class MealConfigError(Exception):
+    pass
+
+class FoodDatabaseHandler(VersionedHandler):
+    # Everything tied to one DB file; swapped together when a new version is adopted.
+    VERSIONED = ('db_path', 'pool', '_has_fts', '_rank_rows', '_nutrient_columns', '_suggest_index', 'count_cache',
+                 '_db_version')
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.getenv('FOOD_NUTRITION_FILE_KEY')
+        self.pool = ConnectionPool(self.db_path)
+        # 'auto' uses the trigram FTS5 index when it has been built, 'fts5'/'like' force an engine.
+        # Both match every query word as a substring of nameKeys.
+        self.engine = os.getenv('FOOD_SEARCH_ENGINE', 'auto')
+        # 'default' keeps the USA-first/country/name-length order, 'bm25' adds FTS5 relevance.
+        self.ranking = os.getenv('FOOD_SEARCH_RANKING', 'default')
+        # Listed first by the default ranking; the search_rank column is used only if it was built for it.
+        self.preferred_country = os.getenv('FOOD_PREFERRED_COUNTRY', 'USA')
+        # /meal_nutrition scales these columns, each holding an amount per nutrient_basis_grams
+        # of food, by the grams under serving_weight_key in the chosen serving.
+        self.meal_nutrients = [
+            column.strip() for column in
+            os.getenv('FOOD_MEAL_NUTRIENTS', 'calories,protein,carbohydrates,fat,fiber').split(',') if column.strip()
+        ]
+        self.nutrient_basis_grams = float(os.getenv('FOOD_NUTRIENT_BASIS_GRAMS', '100'))
+        self.serving_weight_key = os.getenv('FOOD_SERVING_WEIGHT_KEY', 'weight')
+        self._has_fts = None
+        self._rank_rows = None
+        self._nutrient_columns = None
+        self._suggest_index = None
+        self._suggest_index_lock = threading.Lock()
+        self.count_cache = CountCache()
+        self.result_cache = ResultCache('food')
+        self.search_flight = SingleFlight('food')
+        self._db_version = None
+        self._version_lock = threading.Lock()
+
+    @instrument
+    def warm(self):
+        with self.pool.connection() as conn:
+            curr = conn.cursor()
+            self._use_fts(curr)
+            self._ranked_rows(curr)
+            try:
+                self._nutrient_column_names(curr)
+            except MealConfigError as e:
+                logging.error(f"/meal_nutrition can't serve '{self.db_path}': {e}")
+            curr.execute("SELECT * FROM foodNutrient LIMIT 1").fetchall()
+        self.suggest_index()
+
+    def _use_fts(self, curr):
+        if self.engine == 'like':
+            return False
+        if self.engine == 'fts5':
+            return True
+        if self._has_fts is None:
+            curr.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (FOOD_FTS_TABLE,))
+            row = curr.fetchone()
+            # An index from before the trigram tokenizer matches word prefixes, not substrings.
+            self._has_fts = row is not None and 'trigram' in (row[0] or '')
+            if row is not None and not self._has_fts:
+                logging.warning(f"{FOOD_FTS_TABLE} is not a trigram index; searching with LIKE until build-food-fts is rerun.")
+        return self._has_fts
+
+    def _ranked_rows(self, curr):
+        # Row count if `build-food-rank` ran for this preferred country, else 0.
+        if self._rank_rows is None:
+            curr.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FOOD_META_TABLE,))
+            meta = {}
+            if curr.fetchone() is not None:
+                curr.execute(f"SELECT key, value FROM {FOOD_META_TABLE}")
+                meta = dict(curr.fetchall())
+            matches = meta.get('preferred_country') == self.preferred_country and 'rows' in meta
+            self._rank_rows = int(meta['rows']) if matches else 0
+        return self._rank_rows
+
+    def _nutrient_column_names(self, curr):
+        # The configured nutrient columns, checked once per file. A file that doesn't fit the
+        # configuration keeps the reason instead, raised on every /meal_nutrition call.
+        if self._nutrient_columns is None:
+            curr.execute("PRAGMA table_info(foodNutrient)")
+            existing = {row[1] for row in curr.fetchall()}
+            missing = [column for column in self.meal_nutrients if column not in existing]
+            if not self.meal_nutrients:
+                self._nutrient_columns = "FOOD_MEAL_NUTRIENTS names no columns"
+            elif missing:
+                self._nutrient_columns = f"FOOD_MEAL_NUTRIENTS columns missing from foodNutrient: {', '.join(missing)}"
+            else:
+                curr.execute("""
+                    SELECT 1 FROM foodNutrient fn, json_each(CASE WHEN json_valid(fn.serving) THEN fn.serving END) s
+                    WHERE json_type(s.value, ?) IN ('integer', 'real') LIMIT 1
+                """, (f'$."{self.serving_weight_key}"',))
+                if curr.fetchone() is None:
+                    self._nutrient_columns = (
+                        f"No serving in foodNutrient has a numeric '{self.serving_weight_key}' "
+                        f"(FOOD_SERVING_WEIGHT_KEY)"
+                    )
+                else:
+                    self._nutrient_columns = list(self.meal_nutrients)
+        if isinstance(self._nutrient_columns, str):
+            raise MealConfigError(self._nutrient_columns)
+        return self._nutrient_columns
+
+    def _default_order(self):
+        country = self.preferred_country.replace("'", "''")
+        return [
+            f"CASE WHEN fn.country = '{country}' THEN 1 ELSE 2 END",
+            "COALESCE(fn.country, '')", "COALESCE(LENGTH(fn.name), 0)", "fn.id"
+        ]
+
+    def suggest_index(self):
+        if self._suggest_index is None:
+            with self._suggest_index_lock:
+                if self._suggest_index is None:
+                    with self.pool.connection() as conn:
+                        order_by = "fn.search_rank" if self._ranked_rows(conn.cursor()) else ", ".join(self._default_order())
+                        index = SuggestIndex.load(conn, order_by)
+                    stats = index.stats()
+                    logging.info(
+                        f"Built food suggest index over {stats['foods']} foods and {stats['tokens']} tokens: "
+                        f"{stats['memory_bytes'] / 1048576:.1f} MiB in {stats['build_seconds']:.2f}s."
+                    )
+                    self._suggest_index = index
+        return self._suggest_index
+
+    @instrument
+    def suggest(self, query, limit=10):
+        return self.suggest_index().search(query, limit)
+
+    def _like_subquery(self, cleaned_words):
         intersect_queries = []
         params = []
         for word in cleaned_words:
             intersect_queries.append("SELECT id FROM foodNutrient_fts WHERE nameKeys LIKE ?")
             params.append(f"%{word}%")
-        
-        if not intersect_queries:
+        intersect_sql = " INTERSECT ".join(intersect_queries)
+        return f"({intersect_sql})", params
+
+    def _fts_subquery(self, cleaned_words):
+        # A trigram phrase matches any substring of 3+ characters; shorter words keep LIKE.
+        match_expr = " AND ".join(f'"{word}"' for word in cleaned_words if len(word) >= 3)
+        short_words = [word for word in cleaned_words if len(word) < 3]
+        short_filter = "".join(
+            " AND +rowid IN (SELECT id FROM foodNutrient_fts WHERE nameKeys LIKE ?)" for _ in short_words
+        )
+        subquery = f"""(
+            SELECT rowid AS id, bm25({FOOD_FTS_TABLE}) AS score
+            FROM {FOOD_FTS_TABLE}
+            WHERE {FOOD_FTS_TABLE} MATCH ?{short_filter}
+        )"""
+        return subquery, [match_expr] + [f"%{word}%" for word in short_words]
+
+    @instrument
+    def search(self, query, page=1, results_per_page=100, cursor=None, include_total=True):
+        cleaned_words = clean_query(query)
+        if not cleaned_words:
             return None
 
-        intersect_sql = " INTERSECT ".join(intersect_queries)
-        common_ids_subquery = f"({intersect_sql})"
+        version = self.db_version()
+        key = cache_key(self.engine, self.ranking, self.preferred_country, cleaned_words, page, results_per_page,
+                        cursor, include_total)
+        result = self.result_cache.get(key, version)
+        if result is None:
+            def compute():
+                computed = self._search(cleaned_words, page, results_per_page, cursor, include_total)
+                self.result_cache.set(key, version, computed)
+                return computed
+            result = self.search_flight.do((version, key), compute)
+        return result
 
+    def _search(self, cleaned_words, page, results_per_page, cursor, include_total):
+        pool = self.pool
+        conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row  
+            conn = pool.acquire()
             curr = conn.cursor()
+            curr.row_factory = sqlite3.Row
+
+            # Words under 3 characters have no trigram, so they alone can't use the index.
+            use_fts = self._use_fts(curr) and any(len(word) >= 3 for word in cleaned_words)
+            if use_fts:
+                common_ids_subquery, params = self._fts_subquery(cleaned_words)
+            else:
+                common_ids_subquery, params = self._like_subquery(cleaned_words)
+
+            # The sort key doubles as the keyset cursor, so it ends with a unique id.
+            ranking = 'bm25' if use_fts and self.ranking == 'bm25' else 'default'
+            ranked_rows = self._ranked_rows(curr) if ranking == 'default' else 0
+            if ranked_rows:
+                # search_rank is the default order precomputed per row, id tiebreak included.
+                order_terms = ["fn.search_rank"]
+                cursor_kind = "food:rank"
+            else:
+                order_terms = self._default_order()
+                if ranking == 'bm25':
+                    order_terms.insert(1, "common_ids.score")
+                cursor_kind = f"food:{ranking}"
 
             curr.execute(f"SELECT * FROM foodNutrient LIMIT 1")
-            columns = [description[0] for description in curr.description]
+            columns = [description[0] for description in curr.description if description[0] != 'search_rank']
 
-            count_sql = f"SELECT COUNT(*) FROM {common_ids_subquery}"
-            curr.execute(count_sql, params)
-            total_rows = curr.fetchone()[0]
-            if total_rows == 0:
-                return None
+            count_key = cache_key('food', use_fts, cleaned_words)
+            total_rows = None
+            if include_total:
+                total_rows = self.count_cache.get(count_key)
+                if total_rows is None:
+                    count_sql = f"SELECT COUNT(*) FROM {common_ids_subquery}"
+                    curr.execute(count_sql, params)
+                    total_rows = curr.fetchone()[0]
+                    if pool is self.pool:
+                        self.count_cache.set(count_key, total_rows)
+                if total_rows == 0:
+                    return None
 
-            offset = (page - 1) * results_per_page
+            conditions = []
+            data_params = list(params)
+            if cursor:
+                last_key = decode_cursor(cursor, cursor_kind)
+                if len(last_key) != len(order_terms):
+                    raise InvalidCursor("Cursor does not belong to this search")
+                conditions.append(f"({', '.join(order_terms)}) > ({', '.join('?' for _ in order_terms)})")
+                data_params += last_key
+                offset = 0
+            else:
+                offset = (page - 1) * results_per_page
+
+            # With m of n rows matching, walking the rank index reads about n * k / m index
+            # entries to find k rows, while joining reads and sorts all m; walk when m*m > k*n.
+            matches = total_rows if include_total else self.count_cache.get(count_key)
+            walk_index = ranked_rows and matches and matches * matches > (offset + results_per_page + 1) * ranked_rows
 
-            data_sql = f"""
-            SELECT fn.*
-            FROM foodNutrient fn
-            JOIN {common_ids_subquery} common_ids ON fn.id = common_ids.id
-            ORDER BY 
-                CASE WHEN fn.country = 'USA' THEN 1 ELSE 2 END,
-                fn.country,
-                LENGTH(fn.name)
-            LIMIT ? OFFSET ?
-            """
-            data_params = params + [results_per_page, offset]
+            key_columns = ", ".join(f"{term} AS _sort_{i}" for i, term in enumerate(order_terms))
+            if walk_index:
+                conditions.insert(0, f"fn.id IN (SELECT id FROM {common_ids_subquery})")
+                data_sql = f"""
+                SELECT fn.*, {key_columns}
+                FROM foodNutrient fn INDEXED BY {FOOD_RANK_INDEX}
+                WHERE {" AND ".join(conditions)}
+                ORDER BY fn.search_rank
+                LIMIT ? OFFSET ?
+                """
+            else:
+                # Unary + keeps SQLite from walking the rank index for a few matches.
+                order_by = "+fn.search_rank" if ranked_rows else ", ".join(order_terms)
+                data_sql = f"""
+                SELECT fn.*, {key_columns}
+                FROM foodNutrient fn
+                JOIN {common_ids_subquery} common_ids ON fn.id = common_ids.id
+                {"WHERE " + " AND ".join(conditions) if conditions else ""}
+                ORDER BY {order_by}
+                LIMIT ? OFFSET ?
+                """
+            data_params += [results_per_page + 1, offset]
 
             curr.execute(data_sql, data_params)
             rows = curr.fetchall()
+            if not rows and not include_total and not cursor and page == 1:
+                return None
+
+            next_cursor = None
+            if len(rows) > results_per_page:
+                rows = rows[:results_per_page]
+                last = rows[-1]
+                next_cursor = encode_cursor(cursor_kind, [last[f"_sort_{i}"] for i in range(len(order_terms))])
 
             formatted_rows = []
             for row in rows:
@@ -75,8 +427,9 @@ class FoodDatabaseHandler:
 
             return {
                 'total_rows': total_rows,
-                'page': page,
+                'page': None if cursor else page,
                 'results_per_page': results_per_page,
+                'next_cursor': next_cursor,
                 'rows': formatted_rows
             }
 
@@ -85,98 +438,347 @@ class FoodDatabaseHandler:
             return None
         finally:
             if conn:
-                conn.close()
+                pool.release(conn)
 
-class RecipeDatabaseHandler:
-    def __init__(self):
-        self.db_path = os.getenv('RECIPE_FILE_KEY')
+    @instrument
+    def meal_nutrition(self, items):
+        # items are (food id, serving index, quantity); nutrients scale with the serving's
+        # weight in grams times quantity over nutrient_basis_grams.
+        unique_ids = list(dict.fromkeys(food_id for food_id, _, _ in items))
+        pool = self.pool
+        conn = None
+        try:
+            conn = pool.acquire()
+            curr = conn.cursor()
+            columns = self._nutrient_column_names(curr)
+            selected = "".join(f', fn."{column}"' for column in columns)
+            curr.execute(
+                f"SELECT fn.id, fn.name, fn.serving{selected} FROM foodNutrient fn "
+                f"WHERE fn.id IN (SELECT value FROM json_each(?))",
+                (json.dumps(unique_ids),)
+            )
+            rows = curr.fetchall()
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return None
+        finally:
+            if conn:
+                pool.release(conn)
+
+        position = {row[0]: n for n, row in enumerate(rows)}
+        servings = _bulk_decode_servings(rows, 2)
+        values, factors, results, invalid = [], [], [], []
+        total_grams = 0.0
+        for index, (food_id, serving_index, quantity) in enumerate(items):
+            n = position.get(food_id)
+            if n is None:
+                continue
+            options = servings[n]
+            serving = options[serving_index] if isinstance(options, list) and 0 <= serving_index < len(options) else None
+            weight = serving.get(self.serving_weight_key) if isinstance(serving, dict) else None
+            if not isinstance(weight, (int, float)):
+                invalid.append({"index": index, "id": food_id, "serving": serving_index})
+                continue
+            grams = weight * quantity
+            total_grams += grams
+            values.append(rows[n][3:])
+            factors.append(grams / self.nutrient_basis_grams)
+            results.append({
+                "index": index,
+                "id": food_id,
+                "name": rows[n][1],
+                "serving": serving.get("name"),
+                "quantity": quantity,
+                "grams": grams
+            })
+
+        scaled, totals = _scale_nutrients(values, factors)
+        for result, nutrients in zip(results, scaled):
+            result["nutrients"] = dict(zip(columns, nutrients))
+        return {
+            "items": results,
+            "total": {"grams": total_grams, **dict(zip(columns, totals or [0.0] * len(columns)))},
+            "missing": [food_id for food_id in unique_ids if food_id not in position],
+            "invalid": invalid
+        }
+
+class RecipeDatabaseHandler(VersionedHandler):
+    VERSIONED = (
+        'db_path', 'pool', '_title_index', '_diet_index', '_recipe_columns', '_pantry_index', '_filters', '_has_docs',
+        'count_cache', 'doc_cache', '_db_version'
+    )
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.getenv('RECIPE_FILE_KEY')
+        self.pool = ConnectionPool(self.db_path)
+        # 'index' answers keyword queries from an in-memory titleTags index, 'like' scans with SQL.
+        self.engine = os.getenv('RECIPE_SEARCH_ENGINE', 'index')
+        self._title_index = None
+        self._title_index_lock = threading.Lock()
+        self._diet_index = None
+        self._diet_index_lock = threading.Lock()
+        # 'sql' filters in SQLite, 'columnar' evaluates filters over in-memory NumPy columns.
+        self.filter_engine = os.getenv('RECIPE_FILTER_ENGINE', 'sql')
+        self._recipe_columns = None
+        self._recipe_columns_lock = threading.Lock()
+        self._pantry_index = None
+        self._pantry_index_lock = threading.Lock()
+        self.count_cache = CountCache()
+        self._filters = None
+        self.result_cache = ResultCache('recipe')
+        self.search_flight = SingleFlight('recipe')
+        self.doc_cache = LRUCache(int(os.getenv('RECIPE_DOC_CACHE_SIZE', '2048')))
+        self._has_docs = None
+        self._db_version = None
+        self._version_lock = threading.Lock()
+
+    @instrument
+    def warm(self):
+        # Builds everything derived from the file so the first requests after a swap are warm.
+        if self.engine == 'index':
+            self.title_index()
+        if self.filter_engine == 'columnar':
+            self.recipe_columns()
+        self.diet_index()
+        self.pantry_index()
+        self.get_all_filters()
+        with self.pool.connection() as conn:
+            self._docs_available(conn.cursor())
+
+    def title_index(self):
+        if self._title_index is None:
+            with self._title_index_lock:
+                if self._title_index is None:
+                    with self.pool.connection() as conn:
+                        rows = conn.execute("SELECT id, titleTags FROM recipes")
+                        self._title_index = TitleIndex(rows)
+        return self._title_index
+
+    def _keyword_subquery(self, cleaned_words):
+        # ("", []) means no keyword restriction, (None, []) means nothing can match.
+        if not cleaned_words:
+            return "", []
+
+        if self.engine == 'index':
+            matching_ids = self.title_index().search(cleaned_words)
+            if not matching_ids:
+                return None, []
+            return "(SELECT value FROM json_each(?))", [json.dumps(matching_ids)]
+
+        intersect_queries = []
+        keyword_params = []
+        for word in cleaned_words:
+            intersect_queries.append("SELECT id FROM recipes WHERE titleTags LIKE ?")
+            keyword_params.append(f"%{word}%")
+        intersect_sql = " INTERSECT ".join(intersect_queries)
+        return f"({intersect_sql})", keyword_params
 
-    def search(self, query=None, filters=None, page=1, results_per_page=100):
+    @instrument
+    def search(self, query=None, filters=None, page=1, results_per_page=100, cursor=None, include_total=True,
+               facets=False):
         cleaned_words = clean_query(query) if query else None
-        try:
-            conn = sqlite3.connect(self.db_path)
+        version = self.db_version()
+        key = cache_key(cleaned_words or [], filters or {}, page, results_per_page, cursor, include_total, facets)
+        result = self.result_cache.get(key, version)
+        if result is None:
+            def compute():
+                computed = self._search(cleaned_words, filters, page, results_per_page, cursor, include_total, facets)
+                self.result_cache.set(key, version, computed)
+                return computed
+            result = self.search_flight.do((version, key), compute)
+        return result
+
+    def explain_search(self, query=None, filters=None):
+        # EXPLAIN QUERY PLAN details for the page query search() would run.
+        cleaned_words = clean_query(query) if query else None
+        common_ids_subquery, keyword_params = self._keyword_subquery(cleaned_words)
+        if common_ids_subquery is None:
+            return []
+        builder = RecipeQueryBuilder(common_ids_subquery, keyword_params).apply_filters(filters)
+        sql, params = builder.select(limit=1)
+        with self.pool.connection() as conn:
+            return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+    def recipe_columns(self):
+        if self._recipe_columns is None:
+            with self._recipe_columns_lock:
+                if self._recipe_columns is None:
+                    with self.pool.connection() as conn:
+                        self._recipe_columns = RecipeColumns.load(conn) or False
+        return self._recipe_columns or None
+
+    def pantry_index(self):
+        if self._pantry_index is None:
+            with self._pantry_index_lock:
+                if self._pantry_index is None:
+                    with self.pool.connection() as conn:
+                        self._pantry_index = PantryIndex.load(conn)
+        return self._pantry_index
+
+    def _filtered_ids(self, recipe_ids, filters):
+        # The subset of recipe_ids passing the search filters, through the same engines as search().
+        columns = self.recipe_columns() if self.filter_engine == 'columnar' else None
+        if columns is not None:
+            positions = columns.filter_positions(recipe_ids, filters)
+            if positions is not None:
+                return set(columns.ids[positions].tolist())
+        builder = RecipeQueryBuilder("(SELECT value FROM json_each(?))", [json.dumps(recipe_ids)]).apply_filters(filters)
+        sql, params = builder.select(columns="r.id")
+        with self.pool.connection() as conn:
+            return {row[0] for row in conn.execute(sql, params)}
+
+    @instrument
+    def search_by_ingredients(self, ingredients=(), ingredient_ids=(), max_missing=0, filters=None, page=1,
+                              results_per_page=100, cursor=None, include_total=True):
+        version = self.db_version()
+        key = cache_key('pantry', ingredients, ingredient_ids, max_missing, filters or {}, page, results_per_page,
+                        cursor, include_total)
+        result = self.result_cache.get(key, version)
+        if result is None:
+            result = self._search_by_ingredients(ingredients, ingredient_ids, max_missing, filters, page,
+                                                 results_per_page, cursor, include_total)
+            self.result_cache.set(key, version, result)
+        return result
+
+    def _search_by_ingredients(self, ingredients, ingredient_ids, max_missing, filters, page, results_per_page,
+                               cursor, include_total):
+        last_key = decode_cursor(cursor, 'pantry') if cursor else None
+        if last_key is not None and (len(last_key) != 1 or not isinstance(last_key[0], int)):
+            raise InvalidCursor("Cursor does not belong to this search")
+
+        index = self.pantry_index()
+        pantry, unknown = index.resolve(ingredients, ingredient_ids)
+        ranked = index.rank(pantry, max_missing)
+        if ranked and filters:
+            ranked = index.restrict(ranked, lambda recipe_ids: self._filtered_ids(recipe_ids, filters))
+        if not ranked:
+            return None
+
+        # A rank key is the keyset cursor; ranked is sorted by it.
+        start = bisect_right(ranked, last_key[0]) if last_key is not None else (page - 1) * results_per_page
+        page_keys = ranked[start:start + results_per_page + 1]
+        next_cursor = None
+        if len(page_keys) > results_per_page:
+            page_keys = page_keys[:results_per_page]
+            next_cursor = encode_cursor('pantry', [page_keys[-1]])
+        page_entries = [index.decode(key) for key in page_keys]
+
+        rows = {}
+        if page_entries:
+            pool = self.pool
+            try:
+                with pool.connection() as conn:
+                    rows = {row[0]: row for row in conn.execute(
+                        "SELECT id, title, time, calories FROM recipes WHERE id IN (SELECT value FROM json_each(?))",
+                        (json.dumps([recipe_id for _, _, recipe_id in page_entries]),)
+                    )}
+            except sqlite3.Error as e:
+                print(f"Database error: {e}")
+                return None
+
+        result = []
+        for missing, matched, recipe_id in page_entries:
+            row = rows.get(recipe_id)
+            if row is None:
+                continue
+            result.append({
+                "id": row[0],
+                "title": row[1],
+                "time": row[2],
+                "calories": row[3],
+                "matched": matched,
+                "missing": missing,
+                "coverage": round(matched / (matched + missing), 4),
+                "missing_ingredients": index.missing_ingredients(recipe_id, pantry),
+                "image_url": "https://api.quantumgrove.tech:8001/calosync/xxhdpi/fi_alcohol.png"
+            })
+
+        return {
+            'total_rows': len(ranked) if include_total else None,
+            'page': None if cursor else page,
+            'results_per_page': results_per_page,
+            'next_cursor': next_cursor,
+            'unknown_ingredients': unknown,
+            'rows': result
+        }
+
+    def _columnar_page(self, columns, cleaned_words, filters, page, results_per_page, last_key):
+        matching_ids = self.title_index().search(cleaned_words) if cleaned_words else None
+        positions = columns.filter_positions(matching_ids, filters)
+        if positions is None:
+            return None
+        if last_key is not None:
+            after = columns.position_after(last_key)
+            if after is None:
+                return None
+            start = int(np.searchsorted(positions, after))
+        else:
+            start = (page - 1) * results_per_page
+        page_positions = positions[start:start + results_per_page + 1].tolist()
+        return len(positions), [columns.rows[position] for position in page_positions]
+
+    def _sql_page(self, cleaned_words, filters, page, results_per_page, last_key, include_total):
+        common_ids_subquery, keyword_params = self._keyword_subquery(cleaned_words)
+        if common_ids_subquery is None:
+            return 0, []
+
+        pool = self.pool
+        with pool.connection() as conn:
             curr = conn.cursor()
+            builder = RecipeQueryBuilder(common_ids_subquery, keyword_params).apply_filters(filters)
+
+            total_rows = None
+            if include_total:
+                count_key = cache_key('recipe', cleaned_words or [], filters or {})
+                total_rows = self.count_cache.get(count_key)
+                if total_rows is None:
+                    curr.execute(*builder.count())
+                    total_rows = curr.fetchone()[0]
+                    if pool is self.pool:
+                        self.count_cache.set(count_key, total_rows)
+                if total_rows == 0:
+                    return 0, []
 
-            intersect_queries = []
-            keyword_params = []
-            if cleaned_words:
-                for word in cleaned_words:
-                    intersect_queries.append("SELECT id FROM recipes WHERE titleTags LIKE ?")
-                    keyword_params.append(f"%{word}%")
-                intersect_sql = " INTERSECT ".join(intersect_queries)
-                common_ids_subquery = f"({intersect_sql})"
+            if last_key is not None:
+                builder.after(last_key)
+                offset = 0
             else:
-                common_ids_subquery = "(SELECT id FROM recipes)"
+                offset = (page - 1) * results_per_page
 
-            conditions = []
-            filter_params = []
-            if filters:
-                if "category" in filters:
-                    cats = filters["category"]
-                    if not isinstance(cats, (list, tuple)):
-                        cats = [cats]
-                    placeholders = ",".join("?" for _ in cats)
-                    conditions.append(f"r.category IN ({placeholders})")
-                    filter_params.extend(cats)
-
-                if "country" in filters:
-                    countries = filters["country"]
-                    if not isinstance(countries, (list, tuple)):
-                        countries = [countries]
-                    placeholders = ",".join("?" for _ in countries)
-                    conditions.append(f"c.countries IN ({placeholders})")
-                    filter_params.extend(countries)
-
-                if "dietType" in filters:
-                    dts = filters["dietType"]
-                    if not isinstance(dts, (list, tuple)):
-                        dts = [dts]
-                    dt_clauses = []
-                    for dt in dts:
-                        dt_clauses.append("r.dietType LIKE ?")
-                        filter_params.append(f"%{dt}%")
-                    conditions.append("(" + " OR ".join(dt_clauses) + ")")
-
-                num_filters = [
-                    ("calories_min", "r.calories >= ?"),
-                    ("calories_max", "r.calories <= ?"),
-                    ("time_min", "r.time >= ?"),
-                    ("time_max", "r.time <= ?")
-                ]
-                for key, clause in num_filters:
-                    if key in filters:
-                        conditions.append(clause)
-                        filter_params.append(filters[key])
-
-            all_params = keyword_params + filter_params
-
-            base_query = f"""
-                WITH common_ids AS {common_ids_subquery}
-                SELECT r.id, r.title, r.time, r.calories
-                FROM common_ids
-                JOIN recipes r ON common_ids.id = r.id
-                LEFT JOIN countries_recipes cr ON r.id = cr.recipe_id
-                LEFT JOIN countries c ON cr.country_id = c.id
-                LEFT JOIN recipe_ingredients ri ON r.id = ri.recipe_id
-                LEFT JOIN ingredients i ON ri.ingredient_id = i.id
-            """
-
-            if conditions:
-                base_query += " WHERE " + " AND ".join(conditions)
-            base_query += " GROUP BY r.id ORDER BY r.title ASC"
-
-            count_query = f"SELECT COUNT(*) FROM ({base_query})"
-            curr.execute(count_query, all_params)
-            total_rows = curr.fetchone()[0]
+            curr.execute(*builder.select(limit=results_per_page + 1, offset=offset))
+            return total_rows, curr.fetchall()
+
+    def _search(self, cleaned_words, filters, page, results_per_page, cursor, include_total, facets=False):
+        try:
+            last_key = decode_cursor(cursor, 'recipe') if cursor else None
+            if last_key is not None and len(last_key) != 2:
+                raise InvalidCursor("Cursor does not belong to this search")
+
+            # The columnar engine needs keyword matches as ids, i.e. the title index.
+            columns = None
+            if self.filter_engine == 'columnar' and (not cleaned_words or self.engine == 'index'):
+                columns = self.recipe_columns()
+
+            page_rows = None
+            if columns is not None:
+                page_rows = self._columnar_page(columns, cleaned_words, filters, page, results_per_page, last_key)
+            if page_rows is None:
+                columns = None
+                page_rows = self._sql_page(cleaned_words, filters, page, results_per_page, last_key, include_total)
+
+            total_rows, rows = page_rows
             if total_rows == 0:
                 return None
+            if not include_total:
+                total_rows = None
+            if not rows and not include_total and last_key is None and page == 1:
+                return None
 
-            offset = (page - 1) * results_per_page
-            data_query = f"{base_query} LIMIT ? OFFSET ?"
-            data_params = all_params + [results_per_page, offset]
-
-            curr.execute(data_query, data_params)
-            rows = curr.fetchall()
+            # (title, id) is the keyset cursor; both engines order by exactly that.
+            next_cursor = None
+            if len(rows) > results_per_page:
+                rows = rows[:results_per_page]
+                next_cursor = encode_cursor('recipe', [rows[-1][1], rows[-1][0]])
 
             result = []
             for row in rows:
@@ -189,26 +791,41 @@ class RecipeDatabaseHandler:
                 }
                 result.append(recipe)
 
-            return {
+            response = {
                 'total_rows': total_rows,
-                'page': page,
+                'page': None if cursor else page,
                 'results_per_page': results_per_page,
+                'next_cursor': next_cursor,
                 'rows': result
             }
+            if facets:
+                response['facets'] = columns.facet_counts(
+                    self.title_index().search(cleaned_words) if cleaned_words else None, filters
+                ) if columns is not None else None
+            return response
 
         except sqlite3.Error as e:
             print(f"Database error: {e}")
             return None
-        finally:
-            if conn:
-                conn.close()
 
 
     
+    @instrument
     def get_all_filters(self):
+        version = self.db_version()
+        cached = self._filters
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        filters = self._load_filters()
+        if filters is not None:
+            self._filters = (version, filters)
+        return filters
+
+    def _load_filters(self):
+        pool = self.pool
         conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = pool.acquire()
             curr = conn.cursor()
             filters = {}
 
@@ -240,12 +857,32 @@ class RecipeDatabaseHandler:
             return None
         finally:
             if conn:
-                conn.close()
+                pool.release(conn)
     
+    def diet_index(self):
+        if self._diet_index is None:
+            with self._diet_index_lock:
+                if self._diet_index is None:
+                    self._diet_index = self._build_diet_index()
+        return self._diet_index
+
+    @instrument
     def group_recipes_by_diet(self, limit=10):
+        index = self.diet_index()
+        if index is None:
+            return None
+        return [{
+            "diet_type": diet,
+            "recipe_count": recipe_count,
+            "recipes": recipes[:limit]
+        } for diet, recipe_count, recipes in index]
 
+    def _build_diet_index(self):
+        # Every diet's recipes fully ordered by diet_count once per DB, so any limit is a slice.
+        pool = self.pool
+        conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = pool.acquire()
             curr = conn.cursor()
 
             rows = curr.execute('''
@@ -256,7 +893,7 @@ class RecipeDatabaseHandler:
             all_diet_types = []
 
             for id, title, time, calories, dietType in rows:
-                diet_list = json.loads(dietType)
+                diet_list = json.loads(dietType) if dietType else []
                 recipe_entry = {
                     'id': id,
                     'title': title,
@@ -268,7 +905,7 @@ class RecipeDatabaseHandler:
                 }
                 data.append(recipe_entry)
                 all_diet_types.extend(diet_list)
-            all_diet_types = set(all_diet_types)
+            all_diet_types = list(dict.fromkeys(all_diet_types))
             diet_recipes_all = {diet: {} for diet in all_diet_types}
             diet_counts = {diet: 0 for diet in all_diet_types}
 
@@ -279,7 +916,7 @@ class RecipeDatabaseHandler:
                     if recipe_id not in diet_recipes_all[diet]:
                         diet_recipes_all[diet][recipe_id] = recipe
 
-            grouped_output = []
+            index = []
             for diet in all_diet_types:
                 sorted_recipes = sorted(diet_recipes_all[diet].values(), key=lambda x: x['diet_count'])
                 clipped_recipes = [{
@@ -288,93 +925,34 @@ class RecipeDatabaseHandler:
                     'time': rec['time'],
                     'calories': rec['calories'],
                     'image_url': rec['image_url']
-                } for rec in sorted_recipes[:limit]]
-                
-                grouped_output.append({
-                    "diet_type": diet,
-                    "recipe_count": diet_counts[diet],
-                    "recipes": clipped_recipes
-                })
-
-            return grouped_output
+                } for rec in sorted_recipes]
+
+                index.append((diet, diet_counts[diet], clipped_recipes))
+
+            return index
         
         except sqlite3.Error as e:
             print(f"Database error: {e}")
             return None
         finally:
             if conn:
-                conn.close()
+                pool.release(conn)
 
+    @instrument
     def get_recipe_by_id(self, recipe_id):
+        pool = self.pool
         conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = pool.acquire()
             curr = conn.cursor()
 
-            query = """
-                SELECT 
-                    r.id, r.title, r.category, r.time,
-                    r.procedures, r.notes, r.dietType,
-                    r.serving_size, r.servings_per_recipe,
-                    r.calories, r.calories_from_fat,
-                    r.total_fat, r.saturated_fat,
-                    r.cholesterol, r.sodium,
-                    r.total_carbohydrates, r.dietary_fiber,
-                    r.sugars, r.protein,
-                    r.vitamin_a, r.vitamin_c,
-                    r.calcium, r.iron,
-                    r.ingredients, r.titleTags,
-                    GROUP_CONCAT(DISTINCT c.countries) AS countries,
-                    GROUP_CONCAT(DISTINCT i.name) AS ingredients_list
-                FROM recipes r
-                LEFT JOIN countries_recipes cr ON r.id = cr.recipe_id
-                LEFT JOIN countries c ON cr.country_id = c.id
-                LEFT JOIN recipe_ingredients ri ON r.id = ri.recipe_id
-                LEFT JOIN ingredients i ON ri.ingredient_id = i.id
-                WHERE r.id = ?
-                GROUP BY r.id
-            """
-            curr.execute(query, (recipe_id,))
+            curr.execute(RECIPE_DETAIL_SQL.format(where="r.id = ?"), (recipe_id,))
             row = curr.fetchone()
 
             if not row:
                 return None
 
-            procedures = json.loads(row[4]) if row[4] else []
-            notes = json.loads(row[5]) if row[5] else []
-            ingredients = json.loads(row[23]) if row[23] else []
-            dietType = json.loads(row[6]) if row[6] else []
-            countries = row[25].split(',') if row[25] else []
-
-            return {
-                "id": row[0],
-                "title": row[1],
-                "category": row[2],
-                "time": row[3],
-                "procedures": procedures,
-                "notes": notes,
-                "dietType": dietType,  
-                "serving_size": row[7],
-                "servings_per_recipe": row[8],
-                "calories": row[9],
-                "calories_from_fat": row[10],
-                "total_fat": row[11],
-                "saturated_fat": row[12],
-                "cholesterol": row[13],
-                "sodium": row[14],
-                "total_carbohydrates": row[15],
-                "dietary_fiber": row[16],
-                "sugars": row[17],
-                "protein": row[18],
-                "vitamin_a": row[19],
-                "vitamin_c": row[20],
-                "calcium": row[21],
-                "iron": row[22],
-                "ingredients": ingredients,
-                "countries": countries,
-                "ingredients_list": row[26],
-                "image_url": "https://api.quantumgrove.tech:8001/calosync/xxhdpi/fi_alcohol.png"
-            }
+            return format_recipe_row(row)
 
         except sqlite3.Error as e:
             print(f"Database error: {e}")
@@ -384,7 +962,77 @@ class RecipeDatabaseHandler:
             return None
         finally:
             if conn:
-                conn.close()
+                pool.release(conn)
+
+    @instrument
+    def get_recipe_doc(self, recipe_id):
+        # Pre-serialized response bytes: hot ids from the LRU, then the recipe_docs
+        # side table written by `build-recipe-docs`, else built from the live query.
+        doc = self.doc_cache.get(recipe_id)
+        if doc is None:
+            doc = self._load_recipe_doc(recipe_id)
+            if doc is not None:
+                self.doc_cache.set(recipe_id, doc)
+        return doc
+
+    def _docs_available(self, curr):
+        if self._has_docs is None:
+            curr.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (RECIPE_DOCS_TABLE,))
+            self._has_docs = curr.fetchone() is not None
+        return self._has_docs
+
+    def _load_recipe_doc(self, recipe_id):
+        pool = self.pool
+        conn = None
+        try:
+            conn = pool.acquire()
+            curr = conn.cursor()
+            if self._docs_available(curr):
+                curr.execute(f"SELECT doc FROM {RECIPE_DOCS_TABLE} WHERE id = ?", (recipe_id,))
+                row = curr.fetchone()
+                return bytes(row[0]) if row else None
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return None
+        finally:
+            if conn:
+                pool.release(conn)
+
+        recipe = self.get_recipe_by_id(recipe_id)
+        return serialize_recipe(recipe) if recipe else None
+
+    @instrument
+    def get_recipes_by_ids(self, recipe_ids):
+        # One set-based query for the whole batch; results follow the requested order.
+        unique_ids = list(dict.fromkeys(recipe_ids))
+        pool = self.pool
+        conn = None
+        try:
+            conn = pool.acquire()
+            curr = conn.cursor()
+
+            curr.execute(
+                RECIPE_DETAIL_SQL.format(where="r.id IN (SELECT value FROM json_each(?))"),
+                (json.dumps(unique_ids),)
+            )
+            rows = curr.fetchall()
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return None
+        finally:
+            if conn:
+                pool.release(conn)
+
+        found = {}
+        for row, decoded in zip(rows, _bulk_decode_recipe_json(rows)):
+            if decoded is None:
+                continue
+            found[row[0]] = format_recipe_row(row, decoded)
+
+        return {
+            "recipes": [found[recipe_id] for recipe_id in recipe_ids if recipe_id in found],
+            "missing": [recipe_id for recipe_id in unique_ids if recipe_id not in found]
+        }
     
 if __name__ == "__main__":
     pass
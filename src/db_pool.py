@@ -0,0 +1,194 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import quote
+
+from src.metrics import METRICS, InstrumentedConnection
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def pool_size():
+    return _env_int('DB_POOL_SIZE', 8)
+
+
+# Per thread, so the executor can charge pool waits to the call that made them.
+_thread_waits = threading.local()
+
+
+def take_pool_wait():
+    # Seconds this thread waited for pooled connections since the last call.
+    waited = getattr(_thread_waits, 'seconds', 0.0)
+    _thread_waits.seconds = 0.0
+    return waited
+
+
+def file_version(db_path):
+    # Identity of the file currently at db_path; changes whenever a new DB is shipped.
+    try:
+        st = os.stat(db_path)
+    except (OSError, TypeError):
+        return None
+    return f"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+class ConnectionPool:
+    def __init__(self, db_path, size=None, timeout=None):
+        self.db_path = db_path
+        self.size = size or pool_size()
+        self.timeout = timeout if timeout is not None else float(os.getenv('DB_POOL_TIMEOUT', '5'))
+        self.immutable = os.getenv('DB_IMMUTABLE', '1') == '1'
+        self.mmap_size = _env_int('DB_MMAP_SIZE', 256 * 1024 * 1024)
+        self.cache_size_kib = _env_int('DB_CACHE_SIZE_KIB', 32 * 1024)
+        self.cached_statements = _env_int('DB_STATEMENT_CACHE_SIZE', 256)
+
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._generation = 0
+        self._generations = {}
+        self._opened = 0
+        self._in_use = 0
+        self._acquired = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+
+    def _uri(self):
+        uri = f"file:{quote(os.path.abspath(self.db_path))}?mode=ro"
+        if self.immutable:
+            uri += "&immutable=1"
+        return uri
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self._uri(),
+            uri=True,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            factory=InstrumentedConnection if METRICS.enabled else sqlite3.Connection
+        )
+        conn.executescript(f"""
+            PRAGMA mmap_size = {self.mmap_size};
+            PRAGMA cache_size = -{self.cache_size_kib};
+            PRAGMA temp_store = MEMORY;
+            PRAGMA query_only = 1;
+        """)
+        return conn
+
+    def _check_pid(self):
+        # Connections must never cross a fork; a child starts with an empty pool.
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._idle = queue.LifoQueue()
+                    self._generations = {}
+                    self._opened = 0
+                    self._in_use = 0
+
+    def acquire(self):
+        self._check_pid()
+        start = time.perf_counter()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._opened < self.size:
+                    self._opened += 1
+                    opening = True
+                else:
+                    opening = False
+            if opening:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+                with self._lock:
+                    self._generations[id(conn)] = self._generation
+            else:
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._timeouts += 1
+                    raise PoolTimeout(f"No connection to {self.db_path} available after {self.timeout}s")
+                finally:
+                    waited = time.perf_counter() - start
+                    _thread_waits.seconds = getattr(_thread_waits, 'seconds', 0.0) + waited
+                    with self._lock:
+                        self._waits += 1
+                        self._wait_time += waited
+        with self._lock:
+            self._in_use += 1
+            self._acquired += 1
+        METRICS.observe('db_pool_wait_seconds', (os.path.basename(self.db_path),), time.perf_counter() - start)
+        return conn
+
+    def release(self, conn):
+        if isinstance(conn, InstrumentedConnection):
+            conn.finish()
+        with self._lock:
+            self._in_use -= 1
+            stale = self._generations.get(id(conn)) != self._generation
+            if stale:
+                self._generations.pop(id(conn), None)
+                self._opened -= 1
+        if stale:
+            conn.close()
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._generations.pop(id(conn), None)
+                self._opened -= 1
+
+    def reset(self):
+        # Idle connections are closed now, borrowed ones when they are released.
+        with self._lock:
+            self._generation += 1
+        self.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'db_path': self.db_path,
+                'size': self.size,
+                'opened': self._opened,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+                'acquired': self._acquired,
+                'waits': self._waits,
+                'wait_time_ms': round(self._wait_time * 1000, 3),
+                'timeouts': self._timeouts
+            }
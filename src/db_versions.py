@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+
+from src.db_pool import file_version
+
+
+class VersionedHandler:
+    # The versioning half of a DB handler. Subclasses list every attribute tied to one
+    # DB file in VERSIONED and set db_path, pool, result_cache, _db_version and
+    # _version_lock in __init__.
+    VERSIONED = ()
+
+    def db_version(self):
+        # The version being served; new files are picked up by DBVersionManager. Only a
+        # stat, so it is safe on the event loop; the result cache drops entries of other
+        # versions itself on its next write.
+        if self._db_version is None:
+            with self._version_lock:
+                if self._db_version is None:
+                    self._db_version = file_version(self.db_path)
+        return self._db_version
+
+    def stage(self, db_path):
+        # A handler for db_path with its derived state built, ready to be adopted.
+        staged = type(self)(db_path)
+        staged._db_version = file_version(db_path)
+        staged.warm()
+        return staged
+
+    def adopt(self, staged):
+        # Takes over every per-file attribute in one step and returns the replaced pool.
+        old_pool = self.pool
+        self.__dict__.update({name: getattr(staged, name) for name in self.VERSIONED})
+        self.result_cache.invalidate(self._db_version)
+        return old_pool
+
+
+class DBVersionManager:
+    # Moves the food and recipe handlers onto new DB files without a restart.
+    #
+    # A new file is noticed by polling (a changed file at the current path, or a path
+    # requested through request()), staged and warmed in the background, then adopted
+    # by the handler in one step. The replaced pool is reset, so queries already running
+    # finish on the old file and its connections are closed as they are released.
+    #
+    # Requested paths are written to a pointer file shared by every worker on the host
+    # (DB_ACTIVE_PATHS), so the other workers and recycled ones follow within one poll.
+
+    def __init__(self, handlers, interval=None, pointer_path=None):
+        self.handlers = handlers
+        self.interval = interval if interval is not None else float(os.getenv('DB_WATCH_INTERVAL', '5'))
+        self.pointer_path = pointer_path or os.getenv(
+            'DB_ACTIVE_PATHS', os.path.join(tempfile.gettempdir(), 'db_active.json')
+        )
+        self._lock = threading.Lock()
+        self._swap_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pending = {}
+        self._failed = {}
+        self._retired = []
+        self.swaps = 0
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='db-version-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.poll()
+
+    def poll(self):
+        # One watcher round; also called by the prefork supervisor, which runs no thread.
+        try:
+            self.check()
+        except Exception:
+            logging.exception("DB version check failed.")
+        self._reap()
+
+    def _requested_paths(self):
+        try:
+            with open(self.pointer_path) as f:
+                paths = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return paths if isinstance(paths, dict) else {}
+
+    def check(self):
+        # A changed file is only adopted once it looks the same on two polls in a row,
+        # so a file that is still being copied into place is never opened.
+        requested = self._requested_paths()
+        for name, handler in self.handlers.items():
+            path = requested.get(name) or handler.db_path
+            version = file_version(path)
+            if version is None or (path == handler.db_path and version == handler.db_version()):
+                self._pending.pop(name, None)
+                continue
+            if self._failed.get(name) == (path, version):
+                continue
+            if self._pending.get(name) != (path, version):
+                self._pending[name] = (path, version)
+                continue
+            self._pending.pop(name, None)
+            try:
+                self.swap(name, path)
+            except Exception:
+                self._failed[name] = (path, version)
+                logging.exception(f"Could not switch {name} DB to '{path}'; still serving {handler.db_version()}.")
+
+    def request(self, name, path=None):
+        # Switches this worker now, unless it already serves that file, and points the other
+        # workers at the same file.
+        handler = self.handlers[name]
+        path = path or handler.db_path
+        version = file_version(path)
+        if version is None:
+            raise FileNotFoundError(f"Database file '{path}' does not exist.")
+        if path != handler.db_path or version != handler.db_version():
+            version = self.swap(name, path)
+        with self._lock:
+            requested = self._requested_paths()
+            requested[name] = path
+            tmp_path = f"{self.pointer_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(requested, f)
+            os.replace(tmp_path, self.pointer_path)
+        return version
+
+    def swap(self, name, path):
+        handler = self.handlers[name]
+        with self._swap_lock:
+            start = time.perf_counter()
+            staged = handler.stage(path)
+            old_version = handler.db_version()
+            old_pool = handler.adopt(staged)
+            old_pool.reset()
+            with self._lock:
+                self._retired.append((name, old_version, old_pool))
+                self.swaps += 1
+            self._failed.pop(name, None)
+        logging.info(
+            f"Switched {name} DB from {old_version} to {handler.db_version()} ('{path}') "
+            f"after warming for {time.perf_counter() - start:.2f}s."
+        )
+        return handler.db_version()
+
+    def _reap(self):
+        with self._lock:
+            retired = self._retired
+            self._retired = []
+            for name, version, pool in retired:
+                if pool.stats()['in_use'] == 0:
+                    pool.close()
+                    logging.info(f"Released {name} DB version {version}.")
+                else:
+                    self._retired.append((name, version, pool))
+
+    def status(self):
+        with self._lock:
+            draining = {}
+            for name, version, pool in self._retired:
+                draining.setdefault(name, []).append(version)
+        return {
+            name: {
+                'version': handler.db_version(),
+                'db_path': handler.db_path,
+                'draining': draining.get(name, [])
+            }
+            for name, handler in self.handlers.items()
+        }
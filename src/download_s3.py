@@ -1,12 +1,24 @@
 import os
 import sys
+import json
+import time
+import base64
+import hashlib
 import logging
+import threading
 import boto3
 import botocore.exceptions
-import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+MB = 1024 * 1024
+
+
+class ChecksumMismatch(Exception):
+    pass
+
+
 def get_env_var(var_name):
     value = os.getenv(var_name)
     if not value:
@@ -14,50 +26,204 @@ def get_env_var(var_name):
         sys.exit(1)
     return value
 
-def download_file_from_s3(s3_client, bucket, key, destination=None):
+def get_transfer_settings():
+    return {
+        'chunk_size': int(float(os.getenv('S3_CHUNK_SIZE_MB', '16')) * MB),
+        'max_concurrency': int(os.getenv('S3_MAX_CONCURRENCY', '8')),
+        'max_retries': int(os.getenv('S3_MAX_RETRIES', '3'))
+    }
+
+def _load_state(state_path, part_path, etag, size, chunk_size):
+    # Progress of an earlier interrupted download, if it was for the same object version.
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (state.get('etag') != etag or state.get('size') != size or state.get('chunk_size') != chunk_size
+            or not os.path.exists(part_path) or os.path.getsize(part_path) != size):
+        return None
+    return state
+
+def _save_state(state_path, state):
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+def _multipart_etag(path, part_size):
+    digests = []
+    with open(path, 'rb') as f:
+        while True:
+            part = f.read(part_size)
+            if not part:
+                break
+            digests.append(hashlib.md5(part).digest())
+    return f"{hashlib.md5(b''.join(digests)).hexdigest()}-{len(digests)}"
+
+def _file_digest(path, algorithm):
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(MB), b''):
+            digest.update(block)
+    return digest
+
+def verify_download(path, head, chunk_size):
+    size = os.path.getsize(path)
+    if size != head['ContentLength']:
+        raise ChecksumMismatch(f"Size mismatch for '{path}': expected {head['ContentLength']}, got {size}")
+
+    checksum = head.get('ChecksumSHA256')
+    if checksum and '-' not in checksum:
+        actual = base64.b64encode(_file_digest(path, 'sha256').digest()).decode()
+        if actual != checksum:
+            raise ChecksumMismatch(f"SHA256 mismatch for '{path}'")
+        return
+
+    etag = head['ETag'].strip('"')
+    if head.get('ServerSideEncryption') == 'aws:kms':
+        logging.warning(f"ETag of '{path}' is not an MD5 under SSE-KMS; verified size only.")
+        return
+    if '-' not in etag:
+        if _file_digest(path, 'md5').hexdigest() != etag:
+            raise ChecksumMismatch(f"MD5 mismatch for '{path}'")
+        return
+
+    # Multipart ETags depend on the uploader's part size; try the usual ones.
+    parts = int(etag.rsplit('-', 1)[1])
+    candidates = [chunk_size, 8 * MB, 16 * MB, 5 * MB, 15 * MB, 32 * MB, 64 * MB, 100 * MB]
+    candidates.append(-(-size // parts // MB) * MB)
+    checked = False
+    for part_size in dict.fromkeys(candidates):
+        if part_size <= 0 or -(-size // part_size) != parts:
+            continue
+        checked = True
+        if _multipart_etag(path, part_size) == etag:
+            return
+    if checked:
+        raise ChecksumMismatch(f"Multipart ETag mismatch for '{path}'")
+    logging.warning(f"Could not infer the part size behind ETag {etag} of '{path}'; verified size only.")
+
+def _download_chunk(s3_client, bucket, key, etag, fd, start, end, max_retries):
+    for attempt in range(max_retries + 1):
+        try:
+            response = s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}", IfMatch=etag)
+            body = response['Body']
+            offset = start
+            while True:
+                data = body.read(MB)
+                if not data:
+                    break
+                os.pwrite(fd, data, offset)
+                offset += len(data)
+            if offset != end + 1:
+                raise IOError(f"Short read for bytes {start}-{end} of '{key}'")
+            return
+        except (botocore.exceptions.BotoCoreError, botocore.exceptions.ClientError, IOError) as e:
+            if attempt == max_retries:
+                raise
+            logging.warning(f"Retrying bytes {start}-{end} of '{key}' after error: {e}")
+            time.sleep(2 ** attempt)
+
+def download_file_from_s3(s3_client, bucket, key, destination=None, chunk_size=None, max_concurrency=None,
+                          max_retries=None):
     if not destination:
         destination = os.path.basename(key)
+    settings = get_transfer_settings()
+    chunk_size = chunk_size or settings['chunk_size']
+    max_concurrency = max_concurrency or settings['max_concurrency']
+    max_retries = settings['max_retries'] if max_retries is None else max_retries
+
+    part_path = destination + '.part'
+    state_path = destination + '.part.json'
     try:
-        s3_client.download_file(bucket, key, destination)
+        head = s3_client.head_object(Bucket=bucket, Key=key, ChecksumMode='ENABLED')
+        size = head['ContentLength']
+        etag = head['ETag'].strip('"')
+
+        state = _load_state(state_path, part_path, etag, size, chunk_size)
+        if state is None:
+            with open(part_path, 'wb') as f:
+                f.truncate(size)
+            state = {'etag': etag, 'size': size, 'chunk_size': chunk_size, 'done': []}
+            _save_state(state_path, state)
+        else:
+            logging.info(f"Resuming '{key}': {len(state['done'])} chunks already downloaded.")
+
+        done = set(state['done'])
+        chunks = [
+            (index, start, min(start + chunk_size, size) - 1)
+            for index, start in enumerate(range(0, size, chunk_size))
+            if index not in done
+        ]
+        lock = threading.Lock()
+
+        fd = os.open(part_path, os.O_RDWR)
+        try:
+            def fetch(chunk):
+                index, start, end = chunk
+                _download_chunk(s3_client, bucket, key, etag, fd, start, end, max_retries)
+                with lock:
+                    state['done'].append(index)
+                    _save_state(state_path, state)
+
+            with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+                for future in [executor.submit(fetch, chunk) for chunk in chunks]:
+                    future.result()
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        try:
+            verify_download(part_path, head, chunk_size)
+        except ChecksumMismatch:
+            # The partial file can't be trusted for a resume either.
+            os.remove(part_path)
+            os.remove(state_path)
+            raise
+
+        os.replace(part_path, destination)
+        os.remove(state_path)
         logging.info(f"Successfully downloaded '{key}' to '{destination}'.")
     except botocore.exceptions.ClientError as e:
         logging.error(f"Failed to download '{key}' from bucket '{bucket}': {e}")
         raise
 
-def shutdown_system():
-    logging.error("Shutting down the system due to critical failure.")
-    subprocess.call(['sudo', 'shutdown', '-h', 'now'])
-
-def download_db(state=None):
-    aws_access_key = get_env_var('AWS_A_Key')
-    aws_secret_key = get_env_var('AWS_S_Key')
-    aws_region = get_env_var('AWS_Region')
-
+def download_db(state=None, s3_client=None):
     bucket_name = get_env_var('BUCKET_NAME')
     food_nutrition_file_key = get_env_var('FOOD_NUTRITION_FILE_KEY')
     recipe_file_key = get_env_var('RECIPE_FILE_KEY')
 
     try:
-        session = boto3.Session(
-            aws_access_key_id=aws_access_key,
-            aws_secret_access_key=aws_secret_key,
-            region_name=aws_region
-        )
-        s3_client = session.client('s3')
+        if s3_client is None:
+            aws_access_key = get_env_var('AWS_A_Key')
+            aws_secret_key = get_env_var('AWS_S_Key')
+            aws_region = get_env_var('AWS_Region')
+            session = boto3.Session(
+                aws_access_key_id=aws_access_key,
+                aws_secret_access_key=aws_secret_key,
+                region_name=aws_region
+            )
+            s3_client = session.client('s3')
 
         if state is None:
-            download_file_from_s3(s3_client, bucket_name, food_nutrition_file_key)
-            download_file_from_s3(s3_client, bucket_name, recipe_file_key)
+            keys = [food_nutrition_file_key, recipe_file_key]
         elif state == 1:
-            download_file_from_s3(s3_client, bucket_name, food_nutrition_file_key)
+            keys = [food_nutrition_file_key]
         elif state == 2:
-            download_file_from_s3(s3_client, bucket_name, recipe_file_key)
+            keys = [recipe_file_key]
         else:
             logging.warning(f"Invalid state '{state}' provided. No files will be downloaded.")
+            keys = []
+
+        with ThreadPoolExecutor(max_workers=max(len(keys), 1)) as executor:
+            futures = [executor.submit(download_file_from_s3, s3_client, bucket_name, key) for key in keys]
+            for future in futures:
+                future.result()
 
-    except Exception as e:
+    except Exception:
+        # Finished chunks stay in the .part/.part.json files; the supervisor's retry resumes from them.
         logging.exception("An unexpected error occurred during file download.")
-        shutdown_system()
         sys.exit(1)
 
 if __name__ == "__main__":
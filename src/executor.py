@@ -0,0 +1,154 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.db_pool import PoolTimeout, pool_size, take_pool_wait
+
+
+class Overloaded(Exception):
+    pass
+
+
+def _parse_limits(value):
+    # "search_food_paging=8,diet_recommendations=2" -> {"search_food_paging": 8, ...}
+    limits = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            name, limit = item.split("=", 1)
+            limits[name.strip()] = int(limit)
+    return limits
+
+
+class _EndpointState:
+    def __init__(self, limit):
+        self.limit = limit
+        self.semaphore = None
+        self.waiting = 0
+        self.in_flight = 0
+        self.calls = 0
+        self.rejected = 0
+        self.wait_time = 0.0
+        self.pool_wait_time = 0.0
+        self.max_wait = 0.0
+        self.run_time = 0.0
+
+    def stats(self):
+        completed = self.calls or 1
+        return {
+            'limit': self.limit,
+            'waiting': self.waiting,
+            'in_flight': self.in_flight,
+            'calls': self.calls,
+            'rejected': self.rejected,
+            'avg_wait_ms': round(self.wait_time / completed * 1000, 3),
+            'avg_pool_wait_ms': round(self.pool_wait_time / completed * 1000, 3),
+            'max_wait_ms': round(self.max_wait * 1000, 3),
+            'avg_run_ms': round(self.run_time / completed * 1000, 3)
+        }
+
+
+class DBExecutor:
+    # Runs blocking handler calls on a dedicated thread pool so the event loop stays free.
+    # Each endpoint gets its own concurrency limit; a call that cannot start within
+    # queue_timeout seconds raises Overloaded instead of queuing without bound. The
+    # default limit is at most the connection pool size, so admitted calls rarely wait
+    # for a connection; one that times out waiting is Overloaded too.
+
+    def __init__(self, max_workers=None, default_limit=None, queue_timeout=None, limits=None):
+        self.max_workers = max_workers or int(os.getenv('DB_EXECUTOR_THREADS', '16'))
+        self.default_limit = default_limit or int(
+            os.getenv('DB_ENDPOINT_CONCURRENCY', str(min(self.max_workers, pool_size())))
+        )
+        self.queue_timeout = queue_timeout if queue_timeout is not None else float(os.getenv('DB_QUEUE_TIMEOUT', '2'))
+        self.limits = limits if limits is not None else _parse_limits(os.getenv('DB_ENDPOINT_LIMITS'))
+        self._pool = None
+        self._pid = None
+        self._endpoints = {}
+        self._lock = threading.Lock()
+        # Calls handed to the thread pool that no thread has picked up yet.
+        self._queued = 0
+        self._queue_lock = threading.Lock()
+
+    def _executor(self):
+        if self._pool is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pid != os.getpid():
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='db')
+                    self._pid = os.getpid()
+                    self._endpoints = {}
+                    with self._queue_lock:
+                        self._queued = 0
+        return self._pool
+
+    def _endpoint(self, name):
+        state = self._endpoints.get(name)
+        if state is None:
+            state = self._endpoints[name] = _EndpointState(self.limits.get(name, self.default_limit))
+        if state.semaphore is None:
+            state.semaphore = asyncio.Semaphore(state.limit)
+        return state
+
+    def _dequeue(self, started):
+        # Once per call: when a thread starts it, or when it ends without having started.
+        with self._queue_lock:
+            if not started.get('dequeued'):
+                started['dequeued'] = True
+                self._queued -= 1
+
+    async def run(self, endpoint, fn, *args, **kwargs):
+        executor = self._executor()
+        state = self._endpoint(endpoint)
+        loop = asyncio.get_running_loop()
+
+        queued_at = time.perf_counter()
+        state.waiting += 1
+        try:
+            await asyncio.wait_for(state.semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            state.rejected += 1
+            raise Overloaded(f"Too many concurrent '{endpoint}' requests")
+        finally:
+            state.waiting -= 1
+
+        state.in_flight += 1
+        started = {}
+
+        def call():
+            self._dequeue(started)
+            started['at'] = time.perf_counter()
+            take_pool_wait()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                started['pool_wait'] = take_pool_wait()
+
+        with self._queue_lock:
+            self._queued += 1
+        try:
+            return await loop.run_in_executor(executor, call)
+        except PoolTimeout as e:
+            state.rejected += 1
+            raise Overloaded(str(e)) from e
+        finally:
+            self._dequeue(started)
+            finished_at = time.perf_counter()
+            started_at = started.get('at', finished_at)
+            # Time spent waiting for a pooled connection counts as waiting, not running.
+            pool_wait = started.get('pool_wait', 0.0)
+            waited = started_at - queued_at + pool_wait
+            state.in_flight -= 1
+            state.calls += 1
+            state.wait_time += waited
+            state.pool_wait_time += pool_wait
+            state.max_wait = max(state.max_wait, waited)
+            state.run_time += finished_at - started_at - pool_wait
+            state.semaphore.release()
+
+    def stats(self):
+        return {
+            'threads': self.max_workers,
+            'queue_depth': self._queued if self._pid == os.getpid() else 0,
+            'endpoints': {name: state.stats() for name, state in self._endpoints.items()}
+        }
@@ -0,0 +1,161 @@
+import sys
+import string
+import time
+from array import array
+from bisect import bisect_left
+
+_SEPARATORS = str.maketrans(string.punctuation, " " * len(string.punctuation))
+
+
+def suggest_tokens(text):
+    return text.lower().translate(_SEPARATORS).split() if text else []
+
+
+class SuggestIndex:
+    # Prefix index for food-name typeahead.
+    #
+    # Foods are numbered by their position in the default search order, so smaller is
+    # better. Every distinct token of name and nameKeys is kept in one sorted
+    # vocabulary; a query word is a prefix of exactly the tokens in one bisect range,
+    # and that range maps to a run of the flat posting array. Each food also keeps its
+    # token numbers, so a candidate is checked against the other words without sets.
+    #
+    # A query is answered by merging the postings of its most selective word, or, when
+    # the words match a large share of foods, by walking foods in order until the limit.
+
+    def __init__(self, foods, name_keys):
+        start = time.perf_counter()
+        self.ids = array('q')
+        self.names = []
+        self.countries = []
+        country_codes = {}
+        self.country_codes = array('i')
+        position_by_id = {}
+        food_tokens = []
+        for food_id, name, country in foods:
+            position_by_id.setdefault(food_id, len(self.ids))
+            self.ids.append(food_id)
+            self.names.append(name)
+            if country not in country_codes:
+                country_codes[country] = len(self.countries)
+                self.countries.append(country)
+            self.country_codes.append(country_codes[country])
+            food_tokens.append(set(suggest_tokens(name)))
+
+        for food_id, keys in name_keys:
+            position = position_by_id.get(food_id)
+            if position is not None:
+                food_tokens[position].update(suggest_tokens(keys))
+
+        postings = {}
+        for position, tokens in enumerate(food_tokens):
+            for token in tokens:
+                postings.setdefault(token, []).append(position)
+
+        self.tokens = sorted(postings)
+        token_numbers = {token: number for number, token in enumerate(self.tokens)}
+        self.posting_offsets = array('q', [0])
+        self.postings = array('i')
+        for token in self.tokens:
+            self.postings.extend(postings[token])
+            self.posting_offsets.append(len(self.postings))
+
+        self.food_offsets = array('q', [0])
+        self.food_tokens = array('i')
+        for tokens in food_tokens:
+            self.food_tokens.extend(sorted(token_numbers[token] for token in tokens))
+            self.food_offsets.append(len(self.food_tokens))
+
+        self.build_seconds = time.perf_counter() - start
+
+    @classmethod
+    def load(cls, conn, order_by):
+        foods = conn.execute(f"SELECT fn.id, fn.name, fn.country FROM foodNutrient fn ORDER BY {order_by}")
+        name_keys = conn.execute("SELECT id, nameKeys FROM foodNutrient_fts WHERE nameKeys IS NOT NULL")
+        return cls(foods, name_keys)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _token_range(self, word):
+        lo = bisect_left(self.tokens, word)
+        hi = bisect_left(self.tokens, word + "\U0010ffff", lo)
+        return lo, hi
+
+    def _matches(self, position, ranges):
+        # A food's token numbers are sorted, so one bisect per word finds a token in range.
+        start, end = self.food_offsets[position], self.food_offsets[position + 1]
+        tokens = self.food_tokens
+        for lo, hi in ranges:
+            i = bisect_left(tokens, lo, start, end)
+            if i == end or tokens[i] >= hi:
+                return False
+        return True
+
+    def search(self, query, limit=10):
+        words = suggest_tokens(query)
+        if not words:
+            return []
+        ranges = sorted(
+            (self._token_range(word) for word in dict.fromkeys(words)),
+            key=lambda r: self.posting_offsets[r[1]] - self.posting_offsets[r[0]]
+        )
+        size = len(self.ids)
+        counts = [self.posting_offsets[hi] - self.posting_offsets[lo] for lo, hi in ranges]
+        if counts[0] == 0:
+            return []
+
+        # Walking foods in order visits about limit * size / hits positions, with hits
+        # estimated as if the words were independent. The walk gets a budget of as many
+        # positions as merging would read, and merging resumes where it stopped.
+        hits = size
+        for count in counts:
+            hits *= count / size
+        walked = 0
+        found = []
+        if limit * size / max(hits, 1) < counts[0]:
+            walked = min(counts[0], size)
+            for position in range(walked):
+                if self._matches(position, ranges):
+                    found.append(position)
+                    if len(found) == limit:
+                        break
+
+        if len(found) < limit and walked < size:
+            lo, hi = ranges[0]
+            candidates = self.postings[self.posting_offsets[lo]:self.posting_offsets[hi]]
+            if hi - lo > 1:
+                candidates = sorted(set(candidates))
+            for position in candidates[bisect_left(candidates, walked):]:
+                if len(ranges) == 1 or self._matches(position, ranges[1:]):
+                    found.append(position)
+                    if len(found) == limit:
+                        break
+
+        return [{
+            "id": self.ids[position],
+            "name": self.names[position],
+            "country": self.countries[self.country_codes[position]]
+        } for position in found]
+
+    def common_tokens(self, count):
+        # The tokens found in the most foods, most frequent first.
+        sizes = ((self.posting_offsets[n + 1] - self.posting_offsets[n], n) for n in range(len(self.tokens)))
+        return [self.tokens[n] for _, n in sorted(sizes, reverse=True)[:count]]
+
+    def memory_bytes(self):
+        arrays = (self.ids, self.country_codes, self.posting_offsets, self.postings, self.food_offsets, self.food_tokens)
+        return (
+            sum(a.buffer_info()[1] * a.itemsize for a in arrays)
+            + sys.getsizeof(self.names) + sum(sys.getsizeof(name) for name in self.names)
+            + sys.getsizeof(self.tokens) + sum(sys.getsizeof(token) for token in self.tokens)
+        )
+
+    def stats(self):
+        return {
+            'foods': len(self.ids),
+            'tokens': len(self.tokens),
+            'postings': len(self.postings),
+            'memory_bytes': self.memory_bytes(),
+            'build_seconds': round(self.build_seconds, 3)
+        }
@@ -0,0 +1,407 @@
+import os
+import re
+import json
+import time
+import fcntl
+import atexit
+import bisect
+import hashlib
+import logging
+import sqlite3
+import tempfile
+import functools
+import threading
+import weakref
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000, 10000000)
+
+# name -> (help, label names, buckets)
+FAMILIES = {
+    'db_method_seconds': ("Wall time of handler methods.", ('method',), SECONDS_BUCKETS),
+    'db_query_seconds': ("Wall time of SQL statements, execute through last fetch.", ('method', 'sql_id'),
+                         SECONDS_BUCKETS),
+    'db_query_rows': ("Rows returned by SQL statements.", ('method', 'sql_id'), COUNT_BUCKETS),
+    'db_query_vm_steps': ("SQLite VM instructions per statement, a proxy for rows scanned.",
+                          ('method', 'sql_id'), COUNT_BUCKETS),
+    'db_pool_wait_seconds': ("Time spent waiting for a pooled connection.", ('db',), SECONDS_BUCKETS),
+}
+
+# name -> (help, label names)
+COUNTERS = {
+    'result_cache_lookups_total': ("Result cache lookups by outcome (hit, miss, error).", ('cache', 'outcome')),
+}
+
+_context = threading.local()
+slow_query_log = logging.getLogger('slow_query')
+
+
+def current_method():
+    return getattr(_context, 'method', None)
+
+
+def note_tokens(tokens):
+    # Remembered for the slow-query log of whatever handler call is running on this thread.
+    _context.tokens = tokens
+
+
+_PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_CONNECTIVE = re.compile(r"( INTERSECT | OR | AND )")
+
+
+def _statement_shape(sql):
+    # Placeholder lists and runs of one clause repeated per query word or filter value
+    # collapse, so the number of shapes doesn't grow with what clients send.
+    parts = _CONNECTIVE.split(_PLACEHOLDER_LIST.sub("?, ...", " ".join(sql.split())))
+    shape = parts[:1]
+    for n in range(1, len(parts), 2):
+        if parts[n:n + 2] != shape[-2:]:
+            shape += parts[n:n + 2]
+    return "".join(shape)
+
+
+@functools.lru_cache(maxsize=1024)
+def statement_id(sql):
+    shape = _statement_shape(sql)
+    return hashlib.sha1(shape.encode()).hexdigest()[:12], shape
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merge(total, snapshot):
+    for family, series in snapshot.get('families', {}).items():
+        into = total['families'].setdefault(family, {})
+        for key, (buckets, value_sum, count) in series.items():
+            if key in into:
+                previous = into[key]
+                into[key] = ([a + b for a, b in zip(previous[0], buckets)], previous[1] + value_sum, previous[2] + count)
+            else:
+                into[key] = (list(buckets), value_sum, count)
+    for family, series in snapshot.get('counters', {}).items():
+        into = total.setdefault('counters', {}).setdefault(family, {})
+        for key, value in series.items():
+            into[key] = into.get(key, 0) + value
+    total['statements'].update(snapshot.get('statements', {}))
+    return total
+
+
+class Metrics:
+    # Histograms kept per worker process and written to METRICS_DIR/<pid>.json every
+    # METRICS_FLUSH_INTERVAL seconds and at exit. Rendering merges every worker's file;
+    # files of workers that have exited are folded into archive.json so counters stay
+    # monotonic across uvicorn's worker recycling.
+
+    def __init__(self, directory=None):
+        self.enabled = os.getenv('METRICS_ENABLED', '1') == '1'
+        self.directory = directory or os.getenv('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'api_metrics'))
+        self.flush_interval = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+        self.vm_step_interval = int(os.getenv('METRICS_VM_STEP_INTERVAL', '1000'))
+        self.slow_query_seconds = float(os.getenv('SLOW_QUERY_MS', '250')) / 1000
+        # Statement shapes beyond this many are recorded under sql_id 'other'.
+        self.max_statements = int(os.getenv('METRICS_MAX_STATEMENTS', '500'))
+        self._lock = threading.Lock()
+        # Serializes snapshot writes; every thread of a worker writes the same file.
+        self._flush_lock = threading.Lock()
+        self._reset()
+        atexit.register(self.flush)
+
+        slow_log_path = os.getenv('SLOW_QUERY_LOG')
+        if slow_log_path and not slow_query_log.handlers:
+            slow_query_log.addHandler(logging.FileHandler(slow_log_path))
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._series = {}
+        self._counters = {}
+        self._statements = {}
+        self._last_flush = time.monotonic()
+
+    def observe(self, family, labels, value):
+        if not self.enabled:
+            return
+        buckets = FAMILIES[family][2]
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            series = self._series.setdefault(family, {})
+            state = series.get(labels)
+            if state is None:
+                state = series[labels] = [[0] * len(buckets), 0.0, 0]
+            index = bisect.bisect_left(buckets, value)
+            if index < len(buckets):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+            if due:
+                # Claimed here so concurrent observers don't all flush at once.
+                self._last_flush = time.monotonic()
+        if due:
+            self.flush()
+
+    def count(self, family, labels, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            series = self._counters.setdefault(family, {})
+            series[labels] = series.get(labels, 0) + value
+
+    def note_statement(self, sql_id, sql):
+        # The sql_id label to record the statement under.
+        if sql_id in self._statements:
+            return sql_id
+        with self._lock:
+            if sql_id not in self._statements:
+                if len(self._statements) >= self.max_statements:
+                    return 'other'
+                self._statements[sql_id] = sql[:500]
+        return sql_id
+
+    def snapshot(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            return {
+                'families': {
+                    family: {json.dumps(labels): (list(state[0]), state[1], state[2]) for labels, state in series.items()}
+                    for family, series in self._series.items()
+                },
+                'counters': {
+                    family: {json.dumps(labels): value for labels, value in series.items()}
+                    for family, series in self._counters.items()
+                },
+                'statements': dict(self._statements)
+            }
+
+    def flush(self):
+        if not self.enabled:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{os.getpid()}.json")
+            tmp_path = path + '.tmp'
+            with self._flush_lock:
+                with open(tmp_path, 'w') as f:
+                    json.dump(self.snapshot(), f)
+                os.replace(tmp_path, path)
+            with self._lock:
+                self._last_flush = time.monotonic()
+        except OSError as e:
+            logging.warning(f"Could not write metrics snapshot: {e}")
+
+    def collect(self):
+        # Every worker's snapshot merged into one, folding exited workers into the archive.
+        self.flush()
+        total = {'families': {}, 'statements': {}}
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            archive_path = os.path.join(self.directory, 'archive.json')
+            archive = {'families': {}, 'statements': {}}
+            if os.path.exists(archive_path):
+                with open(archive_path) as f:
+                    _merge(archive, json.load(f))
+            archived = False
+            for name in os.listdir(self.directory):
+                if not name.endswith('.json') or not name[:-5].isdigit():
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    with open(path) as f:
+                        snapshot = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if _alive(int(name[:-5])):
+                    _merge(total, snapshot)
+                else:
+                    _merge(archive, snapshot)
+                    os.remove(path)
+                    archived = True
+            if archived:
+                with open(archive_path + '.tmp', 'w') as f:
+                    json.dump(archive, f)
+                os.replace(archive_path + '.tmp', archive_path)
+        return _merge(total, archive)
+
+    def render(self):
+        # Prometheus text exposition format.
+        collected = self.collect()
+        lines = []
+        for family, (help_text, label_names, buckets) in FAMILIES.items():
+            lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} histogram")
+            for key, (counts, value_sum, count) in sorted(collected['families'].get(family, {}).items()):
+                labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(label_names, json.loads(key)))
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{family}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{family}_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f"{family}_sum{{{labels}}} {value_sum}")
+                lines.append(f"{family}_count{{{labels}}} {count}")
+        for family, (help_text, label_names) in COUNTERS.items():
+            lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} counter")
+            for key, count in sorted(collected.get('counters', {}).get(family, {}).items()):
+                labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(label_names, json.loads(key)))
+                lines.append(f"{family}{{{labels}}} {count}")
+        lines.append("# HELP db_statement_info SQL text behind each sql_id label.")
+        lines.append("# TYPE db_statement_info gauge")
+        for sql_id, sql in sorted(collected['statements'].items()):
+            lines.append(f'db_statement_info{{sql_id="{sql_id}",sql="{_escape(sql)}"}} 1')
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+def instrument(fn):
+    # Times a handler method; SQL run beneath it is attributed to it in db_query_*.
+    name = fn.__qualname__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        outer = getattr(_context, 'method', None)
+        if outer is None:
+            _context.method = name
+            _context.tokens = None
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if outer is None:
+                METRICS.observe('db_method_seconds', (name,), time.perf_counter() - start)
+                _context.method = None
+    return wrapper
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # Accumulates one statement's time, rows and VM steps over execute and every fetch,
+    # and records them when the cursor runs its next statement, closes, or its
+    # connection goes back to the pool.
+
+    def __init__(self, connection):
+        super().__init__(connection)
+        self._sql = None
+        connection._cursors.add(self)
+
+    def _begin(self):
+        return time.perf_counter(), self.connection.vm_steps
+
+    def _end(self, begun, rows=0):
+        start, steps = begun
+        self._elapsed += time.perf_counter() - start
+        self._steps += self.connection.vm_steps - steps
+        self._rows += rows
+
+    def execute(self, sql, parameters=()):
+        self.finish()
+        self._sql, self._params = sql, parameters
+        self._method, self._tokens = current_method(), getattr(_context, 'tokens', None)
+        self._elapsed, self._steps, self._rows = 0.0, 0, 0
+        begun = self._begin()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._end(begun)
+
+    def fetchone(self):
+        begun = self._begin()
+        row = super().fetchone()
+        self._end(begun, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        begun = self._begin()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._end(begun, len(rows))
+        return rows
+
+    def fetchall(self):
+        begun = self._begin()
+        rows = super().fetchall()
+        self._end(begun, len(rows))
+        return rows
+
+    def __next__(self):
+        begun = self._begin()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._end(begun)
+            raise
+        self._end(begun, 1)
+        return row
+
+    def close(self):
+        self.finish()
+        super().close()
+
+    def finish(self):
+        if self._sql is None:
+            return
+        sql, self._sql = self._sql, None
+        sql_id, shape = statement_id(sql)
+        labels = (self._method or 'other', METRICS.note_statement(sql_id, shape))
+        METRICS.observe('db_query_seconds', labels, self._elapsed)
+        METRICS.observe('db_query_rows', labels, self._rows)
+        METRICS.observe('db_query_vm_steps', labels, self._steps)
+        if 0 < METRICS.slow_query_seconds <= self._elapsed:
+            self._log_slow(" ".join(sql.split()))
+
+    def _log_slow(self, sql):
+        try:
+            plan = [row[3] for row in sqlite3.Cursor(self.connection).execute(f"EXPLAIN QUERY PLAN {sql}", self._params)]
+        except sqlite3.Error as e:
+            plan = [f"unavailable: {e}"]
+        slow_query_log.warning(json.dumps({
+            'method': self._method,
+            'ms': round(self._elapsed * 1000, 3),
+            'rows': self._rows,
+            'vm_steps': self._steps,
+            'tokens': self._tokens,
+            'sql': sql,
+            'params': [str(param)[:200] for param in self._params],
+            'plan': plan
+        }, default=str))
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cursors = weakref.WeakSet()
+        self._ticks = 0
+        if METRICS.vm_step_interval > 0:
+            self.set_progress_handler(self._tick, METRICS.vm_step_interval)
+
+    def _tick(self):
+        self._ticks += 1
+        return 0
+
+    @property
+    def vm_steps(self):
+        return self._ticks * METRICS.vm_step_interval
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def finish(self):
+        for cursor in list(self._cursors):
+            cursor.finish()
@@ -0,0 +1,151 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import logging
+import argparse
+
+from src.dbHelper import (
+    FOOD_FTS_TABLE, FOOD_META_TABLE, FOOD_RANK_INDEX, RECIPE_DETAIL_SQL, RECIPE_DOCS_TABLE, format_recipe_row,
+    serialize_recipe
+)
+from src.query_builder import RECIPE_INDEXES
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def build_food_fts(db_path):
+    # Trigram tokens make MATCH a substring search, the same rows as the LIKE engine.
+    conn = sqlite3.connect(db_path)
+    try:
+        start = time.perf_counter()
+        with conn:
+            conn.execute(f"DROP TABLE IF EXISTS {FOOD_FTS_TABLE}")
+            conn.execute(f"""
+                CREATE VIRTUAL TABLE {FOOD_FTS_TABLE}
+                USING fts5(nameKeys, content='', tokenize='trigram')
+            """)
+            conn.execute(f"""
+                INSERT INTO {FOOD_FTS_TABLE}(rowid, nameKeys)
+                SELECT id, nameKeys FROM foodNutrient_fts WHERE nameKeys IS NOT NULL
+            """)
+            conn.execute(f"INSERT INTO {FOOD_FTS_TABLE}({FOOD_FTS_TABLE}) VALUES('optimize')")
+        rows = conn.execute("SELECT COUNT(*) FROM foodNutrient_fts WHERE nameKeys IS NOT NULL").fetchone()[0]
+        logging.info(f"Built {FOOD_FTS_TABLE} over {rows} rows in {time.perf_counter() - start:.2f}s.")
+    finally:
+        conn.close()
+
+
+def build_food_rank(db_path, preferred_country):
+    # search_rank is the position of each row in the default food search order, so
+    # ORDER BY search_rank reproduces it and top-k reads can stop early in the index.
+    conn = sqlite3.connect(db_path)
+    try:
+        start = time.perf_counter()
+        with conn:
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(foodNutrient)")]
+            if 'search_rank' not in columns:
+                conn.execute("ALTER TABLE foodNutrient ADD COLUMN search_rank INTEGER")
+            conn.execute(f"DROP INDEX IF EXISTS {FOOD_RANK_INDEX}")
+            conn.execute("""
+                UPDATE foodNutrient SET search_rank = ranked.position
+                FROM (
+                    SELECT id, ROW_NUMBER() OVER (
+                        ORDER BY CASE WHEN country = ? THEN 1 ELSE 2 END,
+                                 COALESCE(country, ''), COALESCE(LENGTH(name), 0), id
+                    ) AS position
+                    FROM foodNutrient
+                ) AS ranked
+                WHERE foodNutrient.id = ranked.id
+            """, (preferred_country,))
+            conn.execute(f"CREATE INDEX {FOOD_RANK_INDEX} ON foodNutrient(search_rank, id)")
+            rows = conn.execute("SELECT COUNT(*) FROM foodNutrient").fetchone()[0]
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {FOOD_META_TABLE} (key TEXT PRIMARY KEY, value TEXT)")
+            conn.executemany(f"INSERT OR REPLACE INTO {FOOD_META_TABLE} (key, value) VALUES (?, ?)", [
+                ('preferred_country', preferred_country),
+                ('rows', str(rows))
+            ])
+        logging.info(f"Ranked {rows} foods with '{preferred_country}' first in {time.perf_counter() - start:.2f}s.")
+    finally:
+        conn.close()
+
+
+def build_recipe_indexes(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        start = time.perf_counter()
+        with conn:
+            for name, target in RECIPE_INDEXES:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+        conn.execute("ANALYZE")
+        conn.commit()
+        logging.info(f"Ensured {len(RECIPE_INDEXES)} recipe indexes in {time.perf_counter() - start:.2f}s.")
+    finally:
+        conn.close()
+
+
+def build_recipe_docs(db_path, batch_size=1000):
+    # Docs must follow the plan live queries will use, and the per-id lookups below
+    # need the recipe_id indexes anyway.
+    build_recipe_indexes(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        start = time.perf_counter()
+        written = 0
+        with conn:
+            conn.execute(f"DROP TABLE IF EXISTS {RECIPE_DOCS_TABLE}")
+            conn.execute(f"CREATE TABLE {RECIPE_DOCS_TABLE} (id INTEGER PRIMARY KEY, doc BLOB NOT NULL)")
+            # Row by row through the live endpoint's statement: GROUP_CONCAT list order
+            # follows the query plan, and a full-table plan orders countries differently.
+            detail = RECIPE_DETAIL_SQL.format(where="r.id = ?")
+            recipe_ids = [row[0] for row in conn.execute("SELECT id FROM recipes ORDER BY id")]
+            for start_at in range(0, len(recipe_ids), batch_size):
+                docs = []
+                for recipe_id in recipe_ids[start_at:start_at + batch_size]:
+                    row = conn.execute(detail, (recipe_id,)).fetchone()
+                    try:
+                        docs.append((row[0], serialize_recipe(format_recipe_row(row))))
+                    except json.JSONDecodeError as e:
+                        logging.warning(f"Skipping recipe {row[0]}: {e}")
+                conn.executemany(f"INSERT INTO {RECIPE_DOCS_TABLE} (id, doc) VALUES (?, ?)", docs)
+                written += len(docs)
+        logging.info(f"Wrote {written} recipe documents in {time.perf_counter() - start:.2f}s.")
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="One-time build steps for shipped DB files.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    food_fts = subparsers.add_parser('build-food-fts', help="Build the FTS5 trigram index used by food search.")
+    food_fts.add_argument('--db', default=os.getenv('FOOD_NUTRITION_FILE_KEY'))
+
+    food_rank = subparsers.add_parser('build-food-rank', help="Precompute the food search order and index it.")
+    food_rank.add_argument('--db', default=os.getenv('FOOD_NUTRITION_FILE_KEY'))
+    food_rank.add_argument('--preferred-country', default=os.getenv('FOOD_PREFERRED_COUNTRY', 'USA'))
+
+    recipe_indexes = subparsers.add_parser('build-recipe-indexes', help="Add the indexes recipe search filters rely on.")
+    recipe_indexes.add_argument('--db', default=os.getenv('RECIPE_FILE_KEY'))
+
+    recipe_docs = subparsers.add_parser('build-recipe-docs', help="Pre-serialize every /recipes/{id} response.")
+    recipe_docs.add_argument('--db', default=os.getenv('RECIPE_FILE_KEY'))
+
+    args = parser.parse_args(argv)
+    if not args.db or not os.path.exists(args.db):
+        logging.error(f"Database file '{args.db}' does not exist.")
+        sys.exit(1)
+
+    if args.command == 'build-food-fts':
+        build_food_fts(args.db)
+    elif args.command == 'build-food-rank':
+        build_food_rank(args.db, args.preferred_country)
+    elif args.command == 'build-recipe-indexes':
+        build_recipe_indexes(args.db)
+    elif args.command == 'build-recipe-docs':
+        build_recipe_docs(args.db)
+
+
+if __name__ == "__main__":
+    main()
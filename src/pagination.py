@@ -0,0 +1,54 @@
+import os
+import json
+import base64
+
+from src.lru import LRUCache
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(kind, key):
+    payload = json.dumps([kind, list(key)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def _valid_key_part(value):
+    # Only values SQLite can bind and compare: text, floats, None and 64-bit integers.
+    if isinstance(value, int):
+        return -2 ** 63 <= value < 2 ** 63
+    return value is None or isinstance(value, (str, float))
+
+
+def decode_cursor(token, kind):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        cursor_kind, key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("Malformed cursor") from e
+    if cursor_kind != kind or not isinstance(key, list):
+        raise InvalidCursor("Cursor does not belong to this search")
+    if not all(_valid_key_part(value) for value in key):
+        raise InvalidCursor("Malformed cursor")
+    return key
+
+
+def cache_key(*parts):
+    # Normalizes token lists and filter dicts so equivalent searches share one entry.
+    normalized = []
+    for part in parts:
+        if isinstance(part, dict):
+            part = sorted(
+                (k, sorted(v) if isinstance(v, (list, tuple)) else v)
+                for k, v in part.items()
+            )
+        elif isinstance(part, (list, tuple, set)):
+            part = sorted(part)
+        normalized.append(part)
+    return json.dumps(normalized, separators=(',', ':'), default=str)
+
+
+class CountCache(LRUCache):
+    def __init__(self, size=None):
+        super().__init__(size or int(os.getenv('COUNT_CACHE_SIZE', '4096')))
@@ -0,0 +1,134 @@
+from array import array
+from collections import Counter
+
+from src.recipe_columns import np
+
+MAX_RECIPES = 1 << 32
+MAX_RECIPE_INGREDIENTS = 0x7FFF
+
+
+class PantryIndex:
+    # Ingredient id -> sorted recipe position arrays over recipe_ingredients, plus every
+    # recipe's own ingredient ids, so "what can I cook with these" is one counting pass
+    # over the pantry's postings instead of a multi-join query.
+    #
+    # A recipe's coverage is how many of its distinct ingredients are in the pantry;
+    # it is missing the rest. Recipes sharing no ingredient with the pantry never match.
+
+    def __init__(self, recipe_ids, links, ingredient_rows):
+        self.recipe_ids = array('q', sorted(set(recipe_ids)))
+        self.position_by_id = {recipe_id: n for n, recipe_id in enumerate(self.recipe_ids)}
+
+        self.names = {}
+        self.ids_by_name = {}
+        for ingredient_id, name in ingredient_rows:
+            self.names[ingredient_id] = name
+            if name:
+                self.ids_by_name.setdefault(name.strip().lower(), []).append(ingredient_id)
+
+        recipe_ingredients = [set() for _ in self.recipe_ids]
+        for recipe_id, ingredient_id in links:
+            position = self.position_by_id.get(recipe_id)
+            if position is not None and ingredient_id is not None:
+                recipe_ingredients[position].add(ingredient_id)
+
+        postings = {}
+        self.recipe_offsets = array('q', [0])
+        self.ingredients = array('q')
+        for position, ingredients in enumerate(recipe_ingredients):
+            for ingredient_id in ingredients:
+                postings.setdefault(ingredient_id, array('i')).append(position)
+            self.ingredients.extend(sorted(ingredients))
+            self.recipe_offsets.append(len(self.ingredients))
+        self.postings = postings
+
+        # rank() keys are signed 64-bit ints: missing and matched get 15 bits each
+        # and the position 32 bits, so larger indexes would overflow into other fields.
+        if len(self.recipe_ids) > MAX_RECIPES:
+            raise ValueError(f"Pantry index holds at most {MAX_RECIPES} recipes")
+        if any(len(ingredients) > MAX_RECIPE_INGREDIENTS for ingredients in recipe_ingredients):
+            raise ValueError(f"Pantry index recipes have at most {MAX_RECIPE_INGREDIENTS} ingredients")
+
+        if np is not None:
+            self._sizes = np.diff(np.frombuffer(self.recipe_offsets, dtype=np.int64))
+            self._ids = np.frombuffer(self.recipe_ids, dtype=np.int64)
+
+    @classmethod
+    def load(cls, conn):
+        recipe_ids = [row[0] for row in conn.execute("SELECT id FROM recipes")]
+        links = conn.execute("SELECT recipe_id, ingredient_id FROM recipe_ingredients")
+        return cls(recipe_ids, links, conn.execute("SELECT id, name FROM ingredients"))
+
+    def resolve(self, names=(), ingredient_ids=()):
+        # The pantry as ingredient ids, and the given names and ids this DB doesn't know.
+        pantry = set()
+        unknown = []
+        for name in names:
+            ids = self.ids_by_name.get(name.strip().lower())
+            if ids:
+                pantry.update(ids)
+            else:
+                unknown.append(name)
+        for ingredient_id in ingredient_ids:
+            if ingredient_id in self.names:
+                pantry.add(ingredient_id)
+            else:
+                unknown.append(ingredient_id)
+        return pantry, unknown
+
+    def rank(self, pantry, max_missing):
+        # Sort keys of every recipe missing at most max_missing ingredients, in ranking
+        # order: fewest missing, then most matched, then id. A key packs
+        # (missing, 0xFFFF - matched, position) into one int, so ranking is a single
+        # integer sort and a key doubles as the keyset cursor.
+        hits = [self.postings[ingredient_id] for ingredient_id in pantry if ingredient_id in self.postings]
+        if not hits:
+            return []
+        if np is not None:
+            counts = np.bincount(np.concatenate([np.frombuffer(posting, dtype=np.int32) for posting in hits]),
+                                 minlength=len(self.recipe_ids))
+            positions = np.flatnonzero(counts)
+            matched = counts[positions]
+            missing = self._sizes[positions] - matched
+            keep = missing <= max_missing
+            keys = (missing[keep] << 48) | ((0xFFFF - matched[keep]) << 32) | positions[keep]
+            keys.sort()
+            return keys.tolist()
+
+        counts = Counter()
+        for posting in hits:
+            counts.update(posting)
+        keys = []
+        for position, matched in counts.items():
+            missing = self.recipe_offsets[position + 1] - self.recipe_offsets[position] - matched
+            if missing <= max_missing:
+                keys.append((missing << 48) | ((0xFFFF - matched) << 32) | position)
+        keys.sort()
+        return keys
+
+    def restrict(self, keys, allowed_ids):
+        # The rank() keys whose recipe is in allowed_ids(recipe ids), order kept.
+        if np is not None:
+            keys = np.array(keys, dtype=np.int64)
+            recipe_ids = self._ids[keys & 0xFFFFFFFF]
+            allowed = np.fromiter(allowed_ids(recipe_ids.tolist()), dtype=np.int64)
+            return keys[np.isin(recipe_ids, allowed)].tolist()
+        recipe_ids = [self.recipe_ids[key & 0xFFFFFFFF] for key in keys]
+        allowed = allowed_ids(recipe_ids)
+        return [key for key, recipe_id in zip(keys, recipe_ids) if recipe_id in allowed]
+
+    def decode(self, key):
+        # (missing, matched, recipe id) of a rank() key.
+        return key >> 48, 0xFFFF - ((key >> 32) & 0xFFFF), self.recipe_ids[key & 0xFFFFFFFF]
+
+    def missing_ingredients(self, recipe_id, pantry):
+        position = self.position_by_id[recipe_id]
+        ingredients = self.ingredients[self.recipe_offsets[position]:self.recipe_offsets[position + 1]]
+        return [self.names.get(ingredient_id) for ingredient_id in ingredients if ingredient_id not in pantry]
+
+    def stats(self):
+        return {
+            'recipes': len(self.recipe_ids),
+            'ingredients': len(self.postings),
+            'postings': len(self.ingredients)
+        }
@@ -0,0 +1,209 @@
+import os
+import gc
+import time
+import signal
+import socket
+import logging
+
+from src.metrics import METRICS
+
+# Filled in by the supervisor before forking, and per worker after it; reported on /stats.
+_state = {'preforked': False, 'warm_up_seconds': None, 'worker': None, 'forked_at': None,
+          'ready_seconds': None, 'first_request_seconds': None}
+
+
+def worker_stats():
+    return {
+        'preforked': _state['preforked'],
+        'pid': os.getpid(),
+        'worker': _state['worker'],
+        'warm_up_seconds': _state['warm_up_seconds'],
+        'ready_seconds': _state['ready_seconds'],
+        'first_request_seconds': _state['first_request_seconds']
+    }
+
+
+def preload_file(path):
+    # Asks the kernel to read the whole DB into the page cache; every worker's mmap then hits it.
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except (OSError, TypeError):
+        return 0
+    try:
+        size = os.fstat(fd).st_size
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(fd, 0, size, os.POSIX_FADV_WILLNEED)
+        return size
+    finally:
+        os.close(fd)
+
+
+def warm_up(food_handler, recipe_handler, food_queries=None):
+    # Builds every derived structure and runs the common food searches once, so forked
+    # workers share the results copy-on-write instead of rebuilding them cold.
+    start = time.perf_counter()
+    preloaded = preload_file(food_handler.db_path) + preload_file(recipe_handler.db_path)
+    recipe_handler.warm()
+    food_handler.warm()
+    if food_queries is None:
+        configured = os.getenv('WARM_FOOD_QUERIES')
+        if configured is not None:
+            food_queries = [query.strip() for query in configured.split(',') if query.strip()]
+        else:
+            food_queries = food_handler.suggest_index().common_tokens(int(os.getenv('WARM_FOOD_QUERY_COUNT', '20')))
+    for query in food_queries:
+        food_handler.search(query, page=1, results_per_page=10)
+
+    # Idle connections are not inherited usefully; each worker opens its own.
+    food_handler.pool.close()
+    recipe_handler.pool.close()
+    elapsed = time.perf_counter() - start
+    logging.info(
+        f"Warmed up in {elapsed:.2f}s: {preloaded / 1048576:.0f} MiB of DB pages preloaded, "
+        f"{len(food_queries)} food searches run."
+    )
+    return elapsed
+
+
+class _FirstRequestTimer:
+    # ASGI wrapper that records how long after the fork the worker finished its lifespan
+    # startup and served its first request.
+
+    def __init__(self, app):
+        self.app = app
+        self.pending = True
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            async def send_startup(message):
+                if message['type'] == 'lifespan.startup.complete':
+                    _note_ready()
+                await send(message)
+            await self.app(scope, receive, send_startup)
+            return
+        if self.pending and scope['type'] == 'http':
+            self.pending = False
+            elapsed = time.monotonic() - _state['forked_at']
+            _state['first_request_seconds'] = round(elapsed, 4)
+            logging.info(f"Worker {_state['worker']} [{os.getpid()}] got its first request {elapsed * 1000:.1f}ms after fork.")
+        await self.app(scope, receive, send)
+
+
+class Supervisor:
+    # Runs uvicorn workers forked from one warmed parent instead of uvicorn's spawned ones.
+    #
+    # The parent binds the socket, runs warm_up() and freezes the GC so the shared
+    # objects' pages stay untouched, then forks the workers. A worker that exits,
+    # including after limit_max_requests, is replaced by a fresh fork of the warm
+    # parent. Between forks the parent follows DB file changes with the version
+    # manager, so replacements start on the current files.
+
+    def __init__(self, app, warm, host='0.0.0.0', port=5000, workers=4, limit_max_requests=None,
+                 db_versions=None):
+        self.app = app
+        self.warm = warm
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.limit_max_requests = limit_max_requests
+        self.db_versions = db_versions
+        self.restart_delay = float(os.getenv('PREFORK_RESTART_DELAY', '1'))
+        self.shutdown_timeout = float(os.getenv('PREFORK_SHUTDOWN_TIMEOUT', '30'))
+        self._children = {}
+        self._stopping = False
+
+    def _bind(self):
+        sock = socket.socket(socket.AF_INET6 if ':' in self.host else socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        return sock
+
+    def run(self):
+        sock = self._bind()
+        _state['preforked'] = True
+        _state['warm_up_seconds'] = round(self.warm(), 3)
+        gc.collect()
+        gc.freeze()
+
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        for worker in range(self.workers):
+            self._spawn(worker, sock)
+        last_poll = time.monotonic()
+        interval = self.db_versions.interval if self.db_versions else 0
+        while self._children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                time.sleep(0.2)
+                if interval > 0 and not self._stopping and time.monotonic() - last_poll >= interval:
+                    self.db_versions.poll()
+                    last_poll = time.monotonic()
+                continue
+            worker, started = self._children.pop(pid)
+            if self._stopping:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if time.monotonic() - started < self.restart_delay:
+                # Crashing on start; don't fork in a tight loop.
+                logging.warning(f"Worker {worker} [{pid}] exited with {code} right after starting.")
+                time.sleep(self.restart_delay)
+            self._spawn(worker, sock)
+        sock.close()
+
+    def _handle_stop(self, signum, frame):
+        if self._stopping:
+            for pid in list(self._children):
+                os.kill(pid, signal.SIGKILL)
+            return
+        self._stopping = True
+        for pid in list(self._children):
+            os.kill(pid, signal.SIGTERM)
+        signal.signal(signal.SIGALRM, self._handle_stop)
+        signal.alarm(max(1, int(self.shutdown_timeout)))
+
+    def _spawn(self, worker, sock):
+        pid = os.fork()
+        if pid:
+            self._children[pid] = (worker, time.monotonic())
+            return
+        code = 1
+        try:
+            code = self._serve(worker, sock)
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else 0
+        except BaseException:
+            logging.exception(f"Worker {worker} [{os.getpid()}] failed.")
+        finally:
+            METRICS.flush()
+            os._exit(code)
+
+    def _serve(self, worker, sock):
+        import uvicorn
+
+        _state['worker'] = worker
+        _state['forked_at'] = time.monotonic()
+        signal.signal(signal.SIGALRM, signal.SIG_DFL)
+        # uvicorn re-raises the stop signal after its graceful shutdown; exit through SystemExit.
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, _exit_worker)
+
+        app = _FirstRequestTimer(self.app)
+        config = uvicorn.Config(app, limit_max_requests=self.limit_max_requests, lifespan='on')
+        server = uvicorn.Server(config)
+        server.run(sockets=[sock])
+        return 0
+
+
+def _exit_worker(signum, frame):
+    raise SystemExit(0)
+
+
+def _note_ready():
+    elapsed = time.monotonic() - _state['forked_at']
+    _state['ready_seconds'] = round(elapsed, 4)
+    logging.info(f"Worker {_state['worker']} [{os.getpid()}] ready {elapsed * 1000:.1f}ms after fork.")
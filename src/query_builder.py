@@ -0,0 +1,87 @@
+RECIPE_INDEXES = [
+    ("idx_recipes_category", "recipes(category)"),
+    ("idx_recipes_calories", "recipes(calories)"),
+    ("idx_recipes_time", "recipes(time)"),
+    ("idx_recipes_title", "recipes(title)"),
+    ("idx_countries_recipes_recipe_country", "countries_recipes(recipe_id, country_id)"),
+    ("idx_recipe_ingredients_recipe_ingredient", "recipe_ingredients(recipe_id, ingredient_id)"),
+]
+
+
+def _as_list(value):
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+class RecipeQueryBuilder:
+    # Builds the recipe search SQL with only the tables a filter actually needs.
+    #
+    # The outer query only ever reads `recipes`, so it yields one row per recipe and
+    # needs no GROUP BY; the country filter is a correlated EXISTS instead of a
+    # fan-out join, and keyword matches arrive as an `r.id IN (...)` subquery.
+
+    NUMERIC_FILTERS = [
+        ("calories_min", "r.calories >= ?"),
+        ("calories_max", "r.calories <= ?"),
+        ("time_min", "r.time >= ?"),
+        ("time_max", "r.time <= ?")
+    ]
+
+    def __init__(self, common_ids_subquery=None, keyword_params=()):
+        self.conditions = []
+        self.params = []
+        if common_ids_subquery:
+            self.where(f"r.id IN {common_ids_subquery}", *keyword_params)
+
+    def where(self, clause, *params):
+        self.conditions.append(clause)
+        self.params.extend(params)
+        return self
+
+    def apply_filters(self, filters):
+        if not filters:
+            return self
+
+        if "category" in filters:
+            cats = _as_list(filters["category"])
+            self.where(f"r.category IN ({','.join('?' for _ in cats)})", *cats)
+
+        if "country" in filters:
+            countries = _as_list(filters["country"])
+            self.where(f"""EXISTS (
+                SELECT 1 FROM countries_recipes cr
+                JOIN countries c ON c.id = cr.country_id
+                WHERE cr.recipe_id = r.id AND c.countries IN ({','.join('?' for _ in countries)})
+            )""", *countries)
+
+        if "dietType" in filters:
+            dts = _as_list(filters["dietType"])
+            self.where(
+                "(" + " OR ".join("r.dietType LIKE ?" for _ in dts) + ")",
+                *[f"%{dt}%" for dt in dts]
+            )
+
+        for key, clause in self.NUMERIC_FILTERS:
+            if key in filters:
+                self.where(clause, filters[key])
+        return self
+
+    def after(self, last_key):
+        # Keyset continuation for ORDER BY r.title, r.id (NULL titles sort first).
+        title, recipe_id = last_key
+        if title is None:
+            return self.where("((r.title IS NULL AND r.id > ?) OR r.title IS NOT NULL)", recipe_id)
+        return self.where("(r.title, r.id) > (?, ?)", title, recipe_id)
+
+    def _where_sql(self):
+        return " WHERE " + " AND ".join(self.conditions) if self.conditions else ""
+
+    def count(self):
+        return f"SELECT COUNT(*) FROM recipes r{self._where_sql()}", list(self.params)
+
+    def select(self, columns="r.id, r.title, r.time, r.calories", limit=None, offset=0):
+        sql = f"SELECT {columns} FROM recipes r{self._where_sql()} ORDER BY r.title ASC, r.id ASC"
+        params = list(self.params)
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        return sql, params
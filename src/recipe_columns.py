@@ -0,0 +1,208 @@
+import json
+import string
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def _like_contains(value, needle):
+    # SQLite `value LIKE '%needle%'` for a needle without wildcards: ASCII-only case folding.
+    return value is not None and needle.translate(_ASCII_LOWER) in str(value).translate(_ASCII_LOWER)
+
+
+def _codes(values):
+    vocabulary = {}
+    codes = np.empty(len(values), dtype=np.int32)
+    for i, value in enumerate(values):
+        codes[i] = -1 if value is None else vocabulary.setdefault(value, len(vocabulary))
+    return codes, list(vocabulary)
+
+
+def _numeric(values):
+    # NULL becomes NaN, which fails every comparison just like NULL does in SQL.
+    if any(value is not None and type(value) not in (int, float) for value in values):
+        return None
+    return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+
+def _parse_diets(raw):
+    try:
+        diets = json.loads(raw) if raw else []
+    except (TypeError, ValueError):
+        return []
+    return [diet for diet in diets if isinstance(diet, str)] if isinstance(diets, list) else []
+
+
+class RecipeColumns:
+    # The recipe catalog as column arrays in `ORDER BY title, id` order, so any filter
+    # combination is a handful of vectorized boolean masks and the matching positions
+    # come out already sorted for paging.
+    #
+    # dietType is kept as a code per distinct raw JSON value; a dietType filter is
+    # evaluated once per distinct value with LIKE semantics and broadcast through the
+    # codes. Columns holding values the SQL comparisons would treat differently (text
+    # in a numeric column, non-text categories) make the engine decline those filters.
+
+    NUMERIC_FILTERS = [
+        ("calories_min", "calories", np.greater_equal if np else None),
+        ("calories_max", "calories", np.less_equal if np else None),
+        ("time_min", "time", np.greater_equal if np else None),
+        ("time_max", "time", np.less_equal if np else None)
+    ]
+
+    def __init__(self, rows, country_rows):
+        self.rows = [(recipe_id, title, time, calories) for recipe_id, title, time, calories, _, _ in rows]
+        self.ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.position_by_id = {recipe_id: i for i, recipe_id in enumerate(self.ids.tolist())}
+        self._id_order = np.argsort(self.ids, kind='stable')
+        self._sorted_ids = self.ids[self._id_order]
+
+        self.numeric = {
+            'time': _numeric([row[2] for row in rows]),
+            'calories': _numeric([row[3] for row in rows])
+        }
+
+        categories = [row[4] for row in rows]
+        self.category_supported = all(value is None or isinstance(value, str) for value in categories)
+        self.category_codes, self.categories = _codes(categories)
+
+        self.diet_codes, self.diet_values = _codes([row[5] for row in rows])
+        self.diet_names = list(dict.fromkeys(
+            name for raw in self.diet_values for name in _parse_diets(raw)
+        ))
+
+        pairs = sorted({
+            (self.position_by_id[recipe_id], country)
+            for recipe_id, country in country_rows
+            if recipe_id in self.position_by_id and country is not None
+        }, key=lambda pair: pair[0])
+        self.country_supported = all(isinstance(country, str) for _, country in pairs)
+        self.country_positions = np.array([pair[0] for pair in pairs], dtype=np.int64)
+        self.country_codes, self.countries = _codes([pair[1] for pair in pairs])
+
+    @classmethod
+    def load(cls, conn):
+        if np is None:
+            return None
+        rows = conn.execute("""
+            SELECT id, title, time, calories, category, dietType
+            FROM recipes ORDER BY title ASC, id ASC
+        """).fetchall()
+        country_rows = conn.execute("""
+            SELECT cr.recipe_id, c.countries
+            FROM countries_recipes cr JOIN countries c ON c.id = cr.country_id
+        """).fetchall()
+        return cls(rows, country_rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _category_mask(self, values):
+        if not self.category_supported:
+            return None
+        wanted = [code for code, category in enumerate(self.categories) if category in values]
+        return np.isin(self.category_codes, wanted)
+
+    def _country_mask(self, values):
+        if not self.country_supported:
+            return None
+        wanted = [code for code, country in enumerate(self.countries) if country in values]
+        mask = np.zeros(len(self.rows), dtype=bool)
+        mask[self.country_positions[np.isin(self.country_codes, wanted)]] = True
+        return mask
+
+    def _diet_mask(self, values):
+        if any(not isinstance(value, str) or '%' in value or '_' in value for value in values):
+            return None
+        wanted = [
+            code for code, raw in enumerate(self.diet_values)
+            if any(_like_contains(raw, value) for value in values)
+        ]
+        return np.isin(self.diet_codes, wanted)
+
+    def _masks(self, matching_ids, filters):
+        # One (facet, mask) pair per active predicate, or None if a predicate is unsupported.
+        masks = []
+        if matching_ids is not None:
+            wanted = np.asarray(matching_ids, dtype=np.int64)
+            found = np.minimum(np.searchsorted(self._sorted_ids, wanted), max(len(self.rows) - 1, 0))
+            found = found[self._sorted_ids[found] == wanted] if len(self.rows) else found[:0]
+            mask = np.zeros(len(self.rows), dtype=bool)
+            mask[self._id_order[found]] = True
+            masks.append(('query', mask))
+
+        filters = filters or {}
+        for facet, build in (('category', self._category_mask), ('country', self._country_mask),
+                             ('dietType', self._diet_mask)):
+            if facet in filters:
+                values = filters[facet]
+                mask = build(list(values) if isinstance(values, (list, tuple)) else [values])
+                if mask is None:
+                    return None
+                masks.append((facet, mask))
+
+        for key, column, compare in self.NUMERIC_FILTERS:
+            if key in filters:
+                values = self.numeric[column]
+                if values is None or not isinstance(filters[key], (int, float)):
+                    return None
+                with np.errstate(invalid='ignore'):
+                    masks.append((key, compare(values, filters[key])))
+        return masks
+
+    @staticmethod
+    def _combine(masks, size, skip=None):
+        combined = np.ones(size, dtype=bool)
+        for facet, mask in masks:
+            if facet != skip:
+                combined &= mask
+        return combined
+
+    def filter_positions(self, matching_ids, filters):
+        masks = self._masks(matching_ids, filters)
+        if masks is None:
+            return None
+        return np.flatnonzero(self._combine(masks, len(self.rows)))
+
+    def position_after(self, last_key):
+        # Global sort position just after the cursor row, found by its (unique) id.
+        position = self.position_by_id.get(last_key[1])
+        if position is None or self.rows[position][1] != last_key[0]:
+            return None
+        return position + 1
+
+    def facet_counts(self, matching_ids, filters):
+        # Counts per category/country/diet value, each under every *other* active filter.
+        masks = self._masks(matching_ids, filters)
+        if masks is None:
+            return None
+        size = len(self.rows)
+
+        category_mask = self._combine(masks, size, skip='category')
+        category_counts = np.bincount(
+            self.category_codes[category_mask & (self.category_codes >= 0)], minlength=len(self.categories)
+        )
+
+        country_mask = self._combine(masks, size, skip='country')
+        country_counts = np.bincount(
+            self.country_codes[country_mask[self.country_positions]], minlength=len(self.countries)
+        )
+
+        diet_mask = self._combine(masks, size, skip='dietType')
+        diet_value_counts = np.bincount(self.diet_codes[diet_mask & (self.diet_codes >= 0)],
+                                        minlength=len(self.diet_values))
+        diet_counts = {}
+        for name in self.diet_names:
+            matching = [code for code, raw in enumerate(self.diet_values) if _like_contains(raw, name)]
+            diet_counts[name] = int(diet_value_counts[matching].sum())
+
+        return {
+            'category': {name: int(count) for name, count in zip(self.categories, category_counts)},
+            'country': {name: int(count) for name, count in zip(self.countries, country_counts)},
+            'dietType': diet_counts
+        }
+
@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import tempfile
+import threading
+
+from src.metrics import METRICS
+
+
+class ResultCache:
+    # Search results shared by every uvicorn worker on the host through one SQLite
+    # file, so recycled workers start warm and the four workers don't duplicate work.
+    # Entries carry the DB version they were computed from and are evicted by TTL,
+    # by version change, and least-recently-used first once the size cap is reached.
+    #
+    # A hit is a plain read: last_access is only rewritten once it is older than
+    # QUERY_CACHE_TOUCH_INTERVAL, and hit/miss counts stay in this process (/metrics
+    # sums them over workers), so lookups never queue on the file's write lock.
+
+    def __init__(self, namespace, path=None):
+        self.namespace = namespace
+        self.path = path or os.getenv(
+            'QUERY_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'query_cache.sqlite3')
+        )
+        self.enabled = os.getenv('QUERY_CACHE_ENABLED', '1') == '1'
+        self.ttl = float(os.getenv('QUERY_CACHE_TTL', '3600'))
+        self.max_bytes = int(os.getenv('QUERY_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+        self.max_entry_bytes = int(os.getenv('QUERY_CACHE_MAX_ENTRY_BYTES', str(1024 * 1024)))
+        self.evict_every = int(os.getenv('QUERY_CACHE_EVICT_EVERY', '64'))
+        self.touch_interval = float(os.getenv('QUERY_CACHE_TOUCH_INTERVAL', '60'))
+        self._local = threading.local()
+        self._sets = 0
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        # The DB version other versions' entries were last dropped for.
+        self._version = None
+        self._outcomes = {'hit': 0, 'miss': 0, 'error': 0}
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=1)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                db_version TEXT,
+                value BLOB,
+                size INTEGER,
+                expires_at REAL,
+                last_access REAL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries(last_access)")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, outcome):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._outcomes = dict.fromkeys(self._outcomes, 0)
+            self._outcomes[outcome] += 1
+        METRICS.count('result_cache_lookups_total', (self.namespace, outcome))
+
+    def get(self, key, db_version):
+        if not self.enabled:
+            return None
+        key = f"{self.namespace}:{key}"
+        try:
+            conn = self._connection()
+            now = time.time()
+            row = conn.execute(
+                "SELECT value, db_version, expires_at, last_access FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logging.warning(f"Query cache read failed: {e}")
+            self._count('error')
+            return None
+        # Stale and expired rows are left for set() to replace and evict() to drop.
+        if row is None or row[1] != db_version or row[2] < now:
+            self._count('miss')
+            return None
+        self._count('hit')
+        if now - row[3] >= self.touch_interval:
+            self._touch(conn, key, now)
+        return json.loads(row[0])
+
+    def _touch(self, conn, key, now):
+        # Best effort: skipped rather than waited on if another worker holds the write lock.
+        try:
+            conn.execute("PRAGMA busy_timeout = 0")
+            with conn:
+                conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+        except sqlite3.Error:
+            pass
+        finally:
+            conn.execute("PRAGMA busy_timeout = 1000")
+
+    def set(self, key, db_version, value):
+        if not self.enabled or value is None:
+            return
+        key = f"{self.namespace}:{key}"
+        payload = json.dumps(value, separators=(',', ':')).encode()
+        if len(payload) > self.max_entry_bytes:
+            return
+        if db_version != self._version:
+            self.invalidate(db_version)
+        try:
+            conn = self._connection()
+            now = time.time()
+            with conn:
+                conn.execute("""
+                    INSERT OR REPLACE INTO entries (key, db_version, value, size, expires_at, last_access)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (key, db_version, payload, len(payload), now + self.ttl, now))
+            with self._lock:
+                self._sets += 1
+                evict = self._sets % self.evict_every == 0
+            if evict:
+                self.evict()
+        except sqlite3.Error as e:
+            logging.warning(f"Query cache write failed: {e}")
+
+    def evict(self):
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM entries WHERE expires_at < ?", (time.time(),))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            # Drop least recently used entries until we are back under the cap.
+            excess = total - self.max_bytes
+            conn.execute("""
+                DELETE FROM entries WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, size, SUM(size) OVER (ORDER BY last_access, key) AS running
+                        FROM entries
+                    ) WHERE running - size < ?
+                )
+            """, (excess,))
+
+    def invalidate(self, db_version):
+        # Drops this namespace's entries computed from any other DB version.
+        if not self.enabled:
+            return
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "DELETE FROM entries WHERE key LIKE ? AND db_version IS NOT ?",
+                    (f"{self.namespace}:%", db_version)
+                )
+            self._version = db_version
+        except sqlite3.Error as e:
+            logging.warning(f"Query cache invalidation failed: {e}")
+
+    def stats(self):
+        if not self.enabled:
+            return {'enabled': False}
+        try:
+            conn = self._connection()
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries WHERE key LIKE ?",
+                (f"{self.namespace}:%",)
+            ).fetchone()
+        except sqlite3.Error as e:
+            return {'enabled': True, 'error': str(e)}
+        with self._lock:
+            outcomes = dict(self._outcomes) if self._pid == os.getpid() else dict.fromkeys(self._outcomes, 0)
+        return {
+            'enabled': True,
+            'entries': entries,
+            'bytes': size,
+            # This worker only; result_cache_lookups_total on /metrics covers all of them.
+            'hits': outcomes['hit'],
+            'misses': outcomes['miss'],
+            'errors': outcomes['error']
+        }
@@ -0,0 +1,78 @@
+import os
+import threading
+
+from src.executor import Overloaded
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    # Concurrent calls with the same key share one execution: the first caller runs it
+    # and the others wait for its result, or its exception. Once max_in_flight distinct
+    # executions are running, a new one is refused with Overloaded instead of queuing
+    # for a pooled connection; callers joining a running execution are never refused.
+
+    def __init__(self, name, max_in_flight=None):
+        self.name = name
+        self.max_in_flight = max_in_flight if max_in_flight is not None else int(
+            os.getenv('SEARCH_MAX_IN_FLIGHT', '0')
+        )
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._pid = os.getpid()
+        self.executions = 0
+        self.coalesced = 0
+        self.shed = 0
+        self.peak_in_flight = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Executions running in the parent at fork time never finish here.
+                self._pid = os.getpid()
+                self._calls = {}
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                if 0 < self.max_in_flight <= len(self._calls):
+                    self.shed += 1
+                    raise Overloaded(f"Too many {self.name} searches in flight")
+                call = self._calls[key] = _Call()
+                self.executions += 1
+                self.peak_in_flight = max(self.peak_in_flight, len(self._calls))
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_in_flight': self.max_in_flight,
+                'in_flight': len(self._calls),
+                'peak_in_flight': self.peak_in_flight,
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+                'shed': self.shed
+            }
@@ -0,0 +1,101 @@
+import string
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+# SQLite's LIKE only folds ASCII letters, so the index must do the same.
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def intersect_sorted(small, large):
+    out = []
+    lo = 0
+    n = len(large)
+    for value in small:
+        lo = bisect_left(large, value, lo)
+        if lo == n:
+            break
+        if large[lo] == value:
+            out.append(value)
+    return out
+
+
+class TitleIndex:
+    # Token -> sorted recipe id posting lists over recipes.titleTags.
+    #
+    # A cleaned query word matches a recipe exactly when `titleTags LIKE '%word%'`
+    # would: words never contain whitespace, so the substring has to sit inside a
+    # single whitespace-separated token, and every token containing the word is
+    # found with one scan over the joined vocabulary.
+
+    def __init__(self, rows, cache_size=1024):
+        postings = {}
+        for recipe_id, title_tags in rows:
+            if not title_tags:
+                continue
+            for token in set(title_tags.translate(_ASCII_LOWER).split()):
+                postings.setdefault(token, []).append(recipe_id)
+
+        self.tokens = sorted(postings)
+        self.postings = [array('q', sorted(postings[token])) for token in self.tokens]
+        self._offsets = []
+        position = 0
+        for token in self.tokens:
+            self._offsets.append(position)
+            position += len(token) + 1
+        self._vocabulary = "\n".join(self.tokens)
+
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    def _word_ids(self, word):
+        with self._lock:
+            ids = self._cache.get(word)
+            if ids is not None:
+                self._cache.move_to_end(word)
+                return ids
+
+        matches = []
+        position = self._vocabulary.find(word)
+        while position != -1:
+            token_index = bisect_right(self._offsets, position) - 1
+            matches.append(self.postings[token_index])
+            if token_index + 1 == len(self._offsets):
+                break
+            position = self._vocabulary.find(word, self._offsets[token_index + 1])
+
+        if not matches:
+            ids = array('q')
+        elif len(matches) == 1:
+            ids = matches[0]
+        else:
+            merged = set()
+            for posting in matches:
+                merged.update(posting)
+            ids = array('q', sorted(merged))
+
+        with self._lock:
+            self._cache[word] = ids
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return ids
+
+    def search(self, cleaned_words):
+        lists = sorted((self._word_ids(word) for word in cleaned_words), key=len)
+        if not lists:
+            return []
+        result = list(lists[0])
+        for posting in lists[1:]:
+            if not result:
+                break
+            result = intersect_sorted(result, posting)
+        return result
+
+    def stats(self):
+        return {
+            'tokens': len(self.tokens),
+            'postings': sum(len(posting) for posting in self.postings),
+            'cached_words': len(self._cache)
+        }
@@ -0,0 +1,27 @@
+import os
+import sys
+import random
+import sqlite3
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.generate import Vocabulary, generate_recipes
+
+
+@pytest.fixture(scope='session')
+def recipe_db(tmp_path_factory):
+    # A small generated recipe DB with the shapes the generator never produces:
+    # NULL titles and NULL calories next to its NULL times and categories.
+    path = str(tmp_path_factory.mktemp('data') / 'recipe.db')
+    rng = random.Random(7)
+    generate_recipes(path, 1500, rng, Vocabulary(rng, 300))
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("UPDATE recipes SET title = NULL WHERE id % 37 = 0")
+        conn.execute("UPDATE recipes SET calories = NULL WHERE id % 23 = 0")
+        conn.execute("UPDATE recipes SET title = (SELECT title FROM recipes WHERE id = 2) WHERE id % 41 = 0")
+    conn.close()
+    return path
+
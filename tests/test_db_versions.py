@@ -0,0 +1,82 @@
+import shutil
+import sqlite3
+
+import pytest
+
+from src.db_versions import DBVersionManager
+from src.dbHelper import RecipeDatabaseHandler
+
+
+@pytest.fixture
+def setup(recipe_db, tmp_path, monkeypatch):
+    monkeypatch.setenv('QUERY_CACHE_ENABLED', '0')
+    old_path = str(tmp_path / 'recipe_v1.db')
+    new_path = str(tmp_path / 'recipe_v2.db')
+    shutil.copy(recipe_db, old_path)
+    shutil.copy(recipe_db, new_path)
+    conn = sqlite3.connect(new_path)
+    with conn:
+        conn.execute("DELETE FROM recipes WHERE id % 2 = 0")
+    conn.close()
+    handler = RecipeDatabaseHandler(old_path)
+    manager = DBVersionManager({'recipe': handler}, interval=0, pointer_path=str(tmp_path / 'active.json'))
+    yield handler, manager, old_path, new_path
+    handler.pool.close()
+
+
+def count(handler):
+    return handler.search(filters={}, results_per_page=1)['total_rows']
+
+
+def test_swap_drains_in_flight_readers_then_reaps(setup):
+    handler, manager, old_path, new_path = setup
+    before = count(handler)
+    old_version = handler.db_version()
+    old_pool = handler.pool
+    reader = old_pool.acquire()
+
+    version = manager.request('recipe', new_path)
+    assert version == handler.db_version() != old_version
+    assert handler.db_path == new_path and handler.pool is not old_pool
+    assert count(handler) < before
+
+    # The in-flight reader finishes on the old file, which stays draining until it is released.
+    assert reader.execute("SELECT COUNT(*) FROM recipes").fetchone()[0] == before
+    manager.poll()
+    assert manager.status()['recipe']['draining'] == [old_version]
+
+    old_pool.release(reader)
+    manager.poll()
+    assert manager.status()['recipe'] == {'version': version, 'db_path': new_path, 'draining': []}
+    assert old_pool.stats()['opened'] == 0
+
+
+def test_request_for_the_active_file_is_a_no_op(setup):
+    handler, manager, old_path, new_path = setup
+    version = handler.db_version()
+    pool = handler.pool
+    assert manager.request('recipe', old_path) == version
+    assert manager.request('recipe') == version
+    assert manager.swaps == 0 and handler.pool is pool
+    assert manager.status()['recipe']['draining'] == []
+
+
+def test_requested_path_is_adopted_by_other_workers(setup, tmp_path):
+    handler, manager, old_path, new_path = setup
+    manager.request('recipe', new_path)
+
+    # Another worker reading the same pointer file follows once the file looks stable for two polls.
+    other = RecipeDatabaseHandler(old_path)
+    follower = DBVersionManager({'recipe': other}, interval=0, pointer_path=manager.pointer_path)
+    follower.poll()
+    assert other.db_path == old_path
+    follower.poll()
+    assert other.db_path == new_path and other.db_version() == handler.db_version()
+    other.pool.close()
+
+
+def test_missing_file_is_refused(setup, tmp_path):
+    handler, manager, old_path, new_path = setup
+    with pytest.raises(FileNotFoundError):
+        manager.request('recipe', str(tmp_path / 'missing.db'))
+    assert handler.db_path == old_path
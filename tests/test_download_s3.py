@@ -0,0 +1,112 @@
+import io
+import os
+import re
+import hashlib
+
+import pytest
+
+pytest.importorskip('boto3')
+
+import botocore.exceptions
+
+from src import download_s3
+from src.download_s3 import ChecksumMismatch, download_file_from_s3
+
+CHUNK = 1024
+
+
+class FakeS3:
+    # Serves one object from memory through the head_object/get_object calls the downloader makes.
+    # After fail_after ranged GETs every further GET fails, like a dropped connection.
+
+    def __init__(self, data, etag=None, fail_after=None):
+        self.data = data
+        self.etag = etag or hashlib.md5(data).hexdigest()
+        self.fail_after = fail_after
+        self.ranges = []
+
+    def head_object(self, Bucket, Key, ChecksumMode=None):
+        return {'ContentLength': len(self.data), 'ETag': f'"{self.etag}"'}
+
+    def get_object(self, Bucket, Key, Range, IfMatch):
+        assert IfMatch == self.etag
+        if self.fail_after is not None and len(self.ranges) >= self.fail_after:
+            raise botocore.exceptions.EndpointConnectionError(endpoint_url='https://s3.fake')
+        start, end = map(int, re.fullmatch(r"bytes=(\d+)-(\d+)", Range).groups())
+        self.ranges.append((start, end))
+        return {'Body': io.BytesIO(self.data[start:end + 1])}
+
+
+@pytest.fixture
+def data():
+    return os.urandom(10 * CHUNK + 123)
+
+
+def download(client, destination):
+    download_file_from_s3(client, 'bucket', 'food.db', destination=destination, chunk_size=CHUNK,
+                          max_concurrency=1, max_retries=0)
+
+
+def test_interrupted_download_resumes(tmp_path, data):
+    destination = str(tmp_path / 'food.db')
+    with pytest.raises(botocore.exceptions.EndpointConnectionError):
+        download(FakeS3(data, fail_after=4), destination)
+    assert not os.path.exists(destination)
+    assert os.path.exists(destination + '.part') and os.path.exists(destination + '.part.json')
+
+    client = FakeS3(data)
+    download(client, destination)
+    # Only the chunks missing after the interruption are fetched again.
+    assert len(client.ranges) == 11 - 4
+    assert min(start for start, _ in client.ranges) == 4 * CHUNK
+    with open(destination, 'rb') as f:
+        assert f.read() == data
+    assert not os.path.exists(destination + '.part') and not os.path.exists(destination + '.part.json')
+
+
+def test_resume_restarts_for_a_new_object_version(tmp_path, data):
+    destination = str(tmp_path / 'food.db')
+    with pytest.raises(botocore.exceptions.EndpointConnectionError):
+        download(FakeS3(data, fail_after=4), destination)
+
+    replaced = os.urandom(len(data))
+    client = FakeS3(replaced)
+    download(client, destination)
+    assert len(client.ranges) == 11
+    with open(destination, 'rb') as f:
+        assert f.read() == replaced
+
+
+def test_checksum_mismatch_installs_nothing(tmp_path, data):
+    destination = str(tmp_path / 'food.db')
+    with open(destination, 'wb') as f:
+        f.write(b'previous version')
+
+    corrupted = FakeS3(data[:-1] + bytes([data[-1] ^ 1]), etag=hashlib.md5(data).hexdigest())
+    with pytest.raises(ChecksumMismatch):
+        download(corrupted, destination)
+    with open(destination, 'rb') as f:
+        assert f.read() == b'previous version'
+    assert not os.path.exists(destination + '.part') and not os.path.exists(destination + '.part.json')
+
+
+def test_download_db_failure_exits_and_keeps_progress(tmp_path, monkeypatch, data):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('BUCKET_NAME', 'bucket')
+    monkeypatch.setenv('FOOD_NUTRITION_FILE_KEY', 'food.db')
+    monkeypatch.setenv('RECIPE_FILE_KEY', 'recipe.db')
+    monkeypatch.setenv('S3_CHUNK_SIZE_MB', str(CHUNK / download_s3.MB))
+    monkeypatch.setenv('S3_MAX_CONCURRENCY', '1')
+    monkeypatch.setenv('S3_MAX_RETRIES', '0')
+
+    with pytest.raises(SystemExit) as exit_info:
+        download_s3.download_db(state=1, s3_client=FakeS3(data, fail_after=3))
+    assert exit_info.value.code == 1
+    assert not os.path.exists('food.db')
+    assert os.path.exists('food.db.part.json')
+
+    client = FakeS3(data)
+    download_s3.download_db(state=1, s3_client=client)
+    assert len(client.ranges) == 11 - 3
+    with open('food.db', 'rb') as f:
+        assert f.read() == data
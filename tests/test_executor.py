@@ -0,0 +1,91 @@
+import time
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+
+from src.db_pool import ConnectionPool
+from src.executor import DBExecutor, Overloaded
+
+
+@pytest.fixture
+def pool(tmp_path):
+    path = str(tmp_path / 'tiny.db')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.close()
+    pool = ConnectionPool(path, size=1, timeout=0.1)
+    yield pool
+    pool.close()
+
+
+def hold_connection(pool, seconds):
+    with pool.connection() as conn:
+        conn.execute("SELECT 1").fetchall()
+        time.sleep(seconds)
+
+
+def test_default_limit_is_capped_by_pool_size(monkeypatch):
+    monkeypatch.delenv('DB_ENDPOINT_CONCURRENCY', raising=False)
+    monkeypatch.setenv('DB_POOL_SIZE', '3')
+    assert DBExecutor(max_workers=16).default_limit == 3
+    assert DBExecutor(max_workers=2).default_limit == 2
+    monkeypatch.setenv('DB_ENDPOINT_CONCURRENCY', '12')
+    assert DBExecutor(max_workers=16).default_limit == 12
+
+
+def test_pool_timeout_is_overloaded(pool):
+    executor = DBExecutor(max_workers=4, default_limit=4, queue_timeout=1)
+
+    async def main():
+        return await asyncio.gather(
+            *(executor.run('hold', hold_connection, pool, 0.3) for _ in range(3)), return_exceptions=True
+        )
+
+    results = asyncio.run(main())
+    assert results.count(None) == 1
+    assert [type(result) for result in results if result is not None] == [Overloaded, Overloaded]
+    stats = executor.stats()['endpoints']['hold']
+    assert stats['rejected'] == 2
+
+
+def test_pool_waits_count_as_waiting(pool):
+    executor = DBExecutor(max_workers=2, default_limit=2, queue_timeout=1)
+    pool.timeout = 5
+
+    async def main():
+        await asyncio.gather(*(executor.run('hold', hold_connection, pool, 0.2) for _ in range(2)))
+
+    asyncio.run(main())
+    stats = executor.stats()['endpoints']['hold']
+    # The second call got a thread at once but waited ~0.2s for the only connection.
+    assert stats['avg_pool_wait_ms'] >= 80
+    assert stats['max_wait_ms'] >= 150
+    assert stats['avg_run_ms'] < 300
+
+
+def test_queue_depth_counts_calls_waiting_for_a_thread():
+    executor = DBExecutor(max_workers=1, default_limit=4, queue_timeout=1)
+    release = threading.Event()
+
+    async def wait_for_depth(depth):
+        for _ in range(200):
+            if executor.stats()['queue_depth'] == depth:
+                return
+            await asyncio.sleep(0.005)
+        assert executor.stats()['queue_depth'] == depth
+
+    async def main():
+        blocker = asyncio.ensure_future(executor.run('slow', release.wait, 5))
+        queued = [asyncio.ensure_future(executor.run('fast', lambda n=n: n)) for n in range(3)]
+        await wait_for_depth(3)
+        # A call cancelled before any thread picked it up leaves the queue too.
+        queued[0].cancel()
+        await wait_for_depth(2)
+        release.set()
+        assert await blocker
+        assert await asyncio.gather(*queued[1:]) == [1, 2]
+        await wait_for_depth(0)
+
+    asyncio.run(main())
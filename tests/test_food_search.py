@@ -0,0 +1,103 @@
+import random
+import shutil
+
+import pytest
+
+from bench.generate import Vocabulary, generate_food
+from src.dbHelper import FoodDatabaseHandler
+from src.migrations import build_food_fts, build_food_rank
+
+
+@pytest.fixture(scope='module')
+def handlers(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('data') / 'food.db')
+    rng = random.Random(3)
+    generate_food(path, 3000, rng, Vocabulary(rng, 200))
+    build_food_fts(path)
+    monkeypatch = pytest.MonkeyPatch()
+    monkeypatch.setenv('QUERY_CACHE_ENABLED', '0')
+    monkeypatch.setenv('FOOD_SEARCH_ENGINE', 'like')
+    like = FoodDatabaseHandler(path)
+    monkeypatch.setenv('FOOD_SEARCH_ENGINE', 'auto')
+    fts = FoodDatabaseHandler(path)
+    monkeypatch.undo()
+    yield like, fts
+    like.pool.close()
+    fts.pool.close()
+
+
+@pytest.mark.parametrize('query', [
+    "berry", "erry", "Cracker Berry", "rry cracker", "ch", "ch ick", "an chicken", "a", "ken ke", "zzq"
+])
+def test_fts_matches_like_substrings(handlers, query):
+    like, fts = handlers
+    with fts.pool.connection() as conn:
+        assert fts._use_fts(conn.cursor())
+    expected = like.search(query, results_per_page=20)
+    assert fts.search(query, results_per_page=20) == expected
+    assert fts.search(query, page=3, results_per_page=7) == like.search(query, page=3, results_per_page=7)
+    if expected and expected['next_cursor']:
+        cursor = expected['next_cursor']
+        assert fts.search(query, results_per_page=20, cursor=cursor) == like.search(query, results_per_page=20,
+                                                                                    cursor=cursor)
+
+
+@pytest.fixture(scope='module')
+def ranked_handlers(tmp_path_factory):
+    # The same foods with and without build-food-rank's search_rank column.
+    directory = tmp_path_factory.mktemp('rank')
+    path = str(directory / 'food.db')
+    rng = random.Random(11)
+    generate_food(path, 4000, rng, Vocabulary(rng, 150))
+    ranked_path = str(directory / 'food_ranked.db')
+    shutil.copy(path, ranked_path)
+    build_food_rank(ranked_path, 'USA')
+    monkeypatch = pytest.MonkeyPatch()
+    monkeypatch.setenv('QUERY_CACHE_ENABLED', '0')
+    monkeypatch.setenv('FOOD_SEARCH_ENGINE', 'like')
+    monkeypatch.setenv('FOOD_PREFERRED_COUNTRY', 'USA')
+    plain, ranked = FoodDatabaseHandler(path), FoodDatabaseHandler(ranked_path)
+    monkeypatch.undo()
+    yield plain, ranked
+    plain.pool.close()
+    ranked.pool.close()
+
+
+def traced(handler, statements):
+    acquire = handler.pool.acquire
+
+    def acquire_traced():
+        conn = acquire()
+        conn.set_trace_callback(statements.append)
+        return conn
+    return acquire_traced
+
+
+def rows(response):
+    return [(row['id'], row['name'], row['country']) for row in response['rows']] if response else []
+
+
+def test_rank_paths_keep_the_expression_order(ranked_handlers, monkeypatch):
+    plain, ranked = ranked_handlers
+    statements = []
+    monkeypatch.setattr(ranked.pool, 'acquire', traced(ranked, statements))
+    walked = set()
+    # Common words make the index walk pay off, rare ones the join and sort.
+    for query in ["chicken", "beef", "fried chicken", "cream", "salmon grilled", "tuna", "mi", "ka lo"]:
+        del statements[:]
+        for page in (1, 2, 5):
+            expected = plain.search(query, page=page, results_per_page=15)
+            actual = ranked.search(query, page=page, results_per_page=15)
+            assert rows(actual) == rows(expected)
+            assert (actual and actual['total_rows']) == (expected and expected['total_rows'])
+
+        expected, actual = plain.search(query, results_per_page=25), ranked.search(query, results_per_page=25)
+        for _ in range(4):
+            assert rows(actual) == rows(expected)
+            if not expected or not expected['next_cursor']:
+                assert not actual or not actual['next_cursor']
+                break
+            expected = plain.search(query, results_per_page=25, cursor=expected['next_cursor'])
+            actual = ranked.search(query, results_per_page=25, cursor=actual['next_cursor'])
+        walked.add(any("INDEXED BY" in statement for statement in statements))
+    assert walked == {True, False}
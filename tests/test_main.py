@@ -0,0 +1,44 @@
+import os
+import asyncio
+import sys
+import subprocess
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_has_no_deprecation_warnings():
+    subprocess.run([sys.executable, '-W', 'error::DeprecationWarning', '-c', 'import main'], cwd=ROOT, check=True)
+
+
+@pytest.mark.parametrize('headers, status', [
+    ({}, 403),
+    ({'X-Admin-Token': 'wrong'}, 403),
+    ({'X-Admin-Token': 'sekrit-'}, 403),
+    ({'X-Admin-Token': 'sekrit'}, 400)
+])
+def test_reload_db_requires_admin_token(monkeypatch, tmp_path, headers, status):
+    monkeypatch.setattr(main, 'admin_token', 'sekrit')
+    response = TestClient(main.app).post(
+        '/admin/reload_db', json={'name': 'food', 'path': str(tmp_path / 'missing.db')}, headers=headers
+    )
+    assert response.status_code == status
+
+
+def test_suggest_index_failure_is_logged(monkeypatch, caplog):
+    def fail():
+        raise RuntimeError("no foodNutrient table")
+
+    monkeypatch.setattr(main.db_handler_food, 'suggest_index', fail)
+    monkeypatch.setattr(main.db_versions, 'start', lambda: None)
+    monkeypatch.setattr(main.db_versions, 'stop', lambda: None)
+    with TestClient(main.app) as client:
+        task = main.app.state.suggest_index_task
+        client.portal.call(asyncio.wait, [task])
+    assert isinstance(task.exception(), RuntimeError)
+    assert "build_suggest_index failed" in caplog.text
+    assert main.db_executor.stats()['endpoints']['food_suggest_index']['calls'] == 1
@@ -0,0 +1,58 @@
+import json
+import random
+import sqlite3
+
+import pytest
+
+from bench.generate import Vocabulary, generate_food
+from src.dbHelper import FoodDatabaseHandler, MealConfigError
+
+
+@pytest.fixture(scope='module')
+def food_db(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('data') / 'food.db')
+    rng = random.Random(5)
+    generate_food(path, 500, rng, Vocabulary(rng, 100))
+    return path
+
+
+def handler(monkeypatch, path, **env):
+    monkeypatch.setenv('QUERY_CACHE_ENABLED', '0')
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    return FoodDatabaseHandler(path)
+
+
+def test_totals_scale_configured_columns(monkeypatch, food_db):
+    food = handler(monkeypatch, food_db, FOOD_MEAL_NUTRIENTS='calories, protein', FOOD_NUTRIENT_BASIS_GRAMS='50')
+    conn = sqlite3.connect(food_db)
+    rows = conn.execute("SELECT id, serving, calories, protein FROM foodNutrient WHERE serving IS NOT NULL LIMIT 20")
+    items, expected = [], {'grams': 0.0, 'calories': 0.0, 'protein': 0.0}
+    for food_id, serving, calories, protein in rows:
+        grams = json.loads(serving)[0]['weight'] * 1.5
+        items.append((food_id, 0, 1.5))
+        expected['grams'] += grams
+        expected['calories'] += calories * grams / 50
+        expected['protein'] += protein * grams / 50
+    conn.close()
+
+    meal = food.meal_nutrition(items)
+    assert set(meal['total']) == {'grams', 'calories', 'protein'}
+    assert meal['total'] == pytest.approx(expected)
+    assert set(meal['items'][0]['nutrients']) == {'calories', 'protein'}
+
+
+def test_unknown_weight_key_fails_loudly(monkeypatch, food_db):
+    food = handler(monkeypatch, food_db, FOOD_SERVING_WEIGHT_KEY='grams')
+    with pytest.raises(MealConfigError, match="'grams'"):
+        food.meal_nutrition([(1, 0, 1)])
+    # warm() reports it without failing the rest of the handler.
+    food.warm()
+    with pytest.raises(MealConfigError):
+        food.meal_nutrition([(1, 0, 1)])
+
+
+def test_unknown_nutrient_column_fails_loudly(monkeypatch, food_db):
+    food = handler(monkeypatch, food_db, FOOD_MEAL_NUTRIENTS='calories,vitamin_k')
+    with pytest.raises(MealConfigError, match='vitamin_k'):
+        food.meal_nutrition([(1, 0, 1)])
@@ -0,0 +1,86 @@
+import os
+import json
+import time
+import threading
+
+from src import metrics as metrics_module
+from src.metrics import Metrics
+
+
+def test_concurrent_flushes_write_one_at_a_time(tmp_path, monkeypatch):
+    metrics = Metrics(directory=str(tmp_path))
+    metrics.enabled = True
+    metrics.flush_interval = 0
+    dump = json.dump
+    writing = []
+    overlaps = []
+
+    def slow_dump(obj, f):
+        writing.append(1)
+        if len(writing) > 1:
+            overlaps.append(len(writing))
+        time.sleep(0.005)
+        dump(obj, f)
+        writing.pop()
+
+    monkeypatch.setattr(metrics_module.json, 'dump', slow_dump)
+    barrier = threading.Barrier(8)
+
+    def observe():
+        barrier.wait()
+        for n in range(20):
+            metrics.observe('db_method_seconds', (f"method{n % 5}",), 0.001)
+            metrics.flush()
+
+    threads = [threading.Thread(target=observe) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    monkeypatch.undo()
+
+    assert overlaps == []
+    with open(tmp_path / f"{os.getpid()}.json") as f:
+        snapshot = json.load(f)
+    assert sum(count for _, _, count in snapshot['families']['db_method_seconds'].values()) == 160
+    assert not os.path.exists(tmp_path / f"{os.getpid()}.json.tmp")
+
+
+def test_observe_claims_the_flush(tmp_path, monkeypatch):
+    # Only the observer that finds the interval elapsed flushes; the others see it claimed.
+    metrics = Metrics(directory=str(tmp_path))
+    metrics.enabled = True
+    metrics.flush_interval = 60
+    metrics._last_flush -= 120
+    flushes = []
+    monkeypatch.setattr(metrics, 'flush', lambda: flushes.append(1) or time.sleep(0.05))
+    barrier = threading.Barrier(8)
+
+    def observe():
+        barrier.wait()
+        metrics.observe('db_method_seconds', ('method',), 0.001)
+
+    threads = [threading.Thread(target=observe) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(flushes) == 1
+
+
+def test_statement_shapes_do_not_grow_with_query_words():
+    def like_chain(words):
+        return "(" + " INTERSECT ".join("SELECT id FROM t WHERE k LIKE ?" for _ in range(words)) + ")"
+
+    ids = {metrics_module.statement_id(f"SELECT * FROM x WHERE c IN ({','.join('?' * n)}) AND id IN {like_chain(n)}")[0]
+           for n in range(1, 40)}
+    assert len(ids) <= 3
+
+
+def test_statements_past_the_cap_share_other(tmp_path):
+    metrics = Metrics(directory=str(tmp_path))
+    metrics.max_statements = 3
+    labels = [metrics.note_statement(f"id{n}", f"SELECT {n}") for n in range(5)]
+    assert labels == ['id0', 'id1', 'id2', 'other', 'other']
+    assert metrics.note_statement('id1', "SELECT 1") == 'id1'
+    assert sorted(metrics.snapshot()['statements']) == ['id0', 'id1', 'id2']
@@ -0,0 +1,86 @@
+import random
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from bench.generate import Vocabulary, generate_food
+from src.dbHelper import FoodDatabaseHandler, RecipeDatabaseHandler
+from src.migrations import build_food_rank
+from src.pagination import InvalidCursor, decode_cursor, encode_cursor
+
+
+@pytest.fixture(scope='module')
+def client(recipe_db, tmp_path_factory):
+    food_path = str(tmp_path_factory.mktemp('data') / 'food.db')
+    rng = random.Random(9)
+    generate_food(food_path, 2000, rng, Vocabulary(rng, 150))
+    build_food_rank(food_path, 'USA')
+    monkeypatch = pytest.MonkeyPatch()
+    monkeypatch.setenv('QUERY_CACHE_ENABLED', '0')
+    monkeypatch.setattr(main, 'db_handler_food', FoodDatabaseHandler(food_path))
+    monkeypatch.setattr(main, 'db_handler_recipe', RecipeDatabaseHandler(recipe_db))
+    yield TestClient(main.app)
+    main.db_handler_food.pool.close()
+    main.db_handler_recipe.pool.close()
+    monkeypatch.undo()
+
+
+SEARCHES = [
+    ('/search_food_paging', {'food_name': 'chicken'}, 'food:rank'),
+    ('/recipes_filter_paginated', {'category': 'Dinner'}, 'recipe'),
+    ('/recipes_by_ingredients', {'ingredient': ['chicken', 'rice'], 'max_missing': 8}, 'pantry')
+]
+
+
+def test_round_trip():
+    for key in ([3], ["Apple Pie", 17], [None, 4], [1, "USA", 12, 5], [2 ** 63 - 1, -2 ** 63, 0.5]):
+        assert decode_cursor(encode_cursor('recipe', key), 'recipe') == key
+
+
+@pytest.mark.parametrize('token', [
+    'garbage!!',
+    'e30',
+    encode_cursor('food:rank', [3]) + 'x',
+    encode_cursor('food:rank', [3])[:-4],
+    encode_cursor('recipe', [None, 4]),
+    encode_cursor('food:rank', [{'id': 1}]),
+    encode_cursor('food:rank', [[1]]),
+    encode_cursor('food:rank', [2 ** 63])
+])
+def test_invalid_tokens(token):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(token, 'food:rank')
+
+
+@pytest.mark.parametrize('path, params, kind', SEARCHES)
+def test_tampered_cursors_are_rejected(client, path, params, kind):
+    other_kind = 'recipe' if kind != 'recipe' else 'pantry'
+    for cursor in ['garbage!!', 'e30', encode_cursor(other_kind, [1]), encode_cursor(kind, [{'x': 1}, 2]),
+                   encode_cursor(kind, [[1], 2]), encode_cursor(kind, [2 ** 70]), encode_cursor(kind, [1, 2, 3, 4, 5])]:
+        response = client.get(path, params={**params, 'cursor': cursor})
+        assert response.status_code == 400, (cursor, response.text)
+
+
+def page_ids(response):
+    return [row['id'] for row in response.json()['response']['rows']]
+
+
+@pytest.mark.parametrize('path, params, kind', SEARCHES)
+def test_cursor_walk_visits_every_row_once(client, path, params, kind):
+    first = client.get(path, params={**params, 'results_per_page': 7}).json()['response']
+    total = first['total_rows']
+    walked = [row['id'] for row in first['rows']]
+    cursor = first['next_cursor']
+    while cursor:
+        assert decode_cursor(cursor, kind)
+        page = client.get(path, params={**params, 'results_per_page': 7, 'cursor': cursor}).json()['response']
+        walked += [row['id'] for row in page['rows']]
+        cursor = page['next_cursor']
+
+    assert len(walked) == len(set(walked)) == total > 7
+    # The same rows in the same order as offset paging.
+    paged = []
+    for page in range(1, -(-total // 50) + 1):
+        paged += page_ids(client.get(path, params={**params, 'results_per_page': 50, 'page': page}))
+    assert walked == paged
@@ -0,0 +1,76 @@
+import random
+import sqlite3
+
+import pytest
+
+from src import pantry_index
+from src.pantry_index import MAX_RECIPE_INGREDIENTS, PantryIndex
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def engine(request, monkeypatch):
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(pantry_index, 'np', None)
+    return request.param
+
+
+def brute_force(recipes, pantry, max_missing):
+    ranked = []
+    for recipe_id, ingredients in recipes.items():
+        matched = len(ingredients & pantry)
+        missing = len(ingredients) - matched
+        if matched and missing <= max_missing:
+            ranked.append((missing, -matched, recipe_id))
+    return [(missing, -negated, recipe_id) for missing, negated, recipe_id in sorted(ranked)]
+
+
+def ranked(index, pantry, max_missing):
+    return [index.decode(key) for key in index.rank(pantry, max_missing)]
+
+
+def test_matches_brute_force_on_a_generated_db(engine, recipe_db):
+    conn = sqlite3.connect(recipe_db)
+    index = PantryIndex.load(conn)
+    recipes = {recipe_id: set() for (recipe_id,) in conn.execute("SELECT id FROM recipes")}
+    for recipe_id, ingredient_id in conn.execute("SELECT recipe_id, ingredient_id FROM recipe_ingredients"):
+        recipes[recipe_id].add(ingredient_id)
+    ingredient_ids = [row[0] for row in conn.execute("SELECT id FROM ingredients")]
+    conn.close()
+
+    rng = random.Random(4)
+    for _ in range(30):
+        pantry = set(rng.sample(ingredient_ids, rng.randint(1, 40)))
+        max_missing = rng.choice([0, 1, 3, 8, 20])
+        assert ranked(index, pantry, max_missing) == brute_force(recipes, pantry, max_missing)
+
+
+def test_ties_rank_by_recipe_id(engine):
+    # Recipes 30, 10 and 20 all match two and miss one; 40 matches two and misses none.
+    links = [(30, 1), (30, 2), (30, 9), (10, 1), (10, 2), (10, 8), (20, 2), (20, 3), (20, 7), (40, 1), (40, 3),
+             (50, 9), (60, None), (10, 1)]
+    index = PantryIndex([10, 20, 30, 40, 50, 60], links, [(n, f"i{n}") for n in range(1, 10)])
+    assert ranked(index, {1, 2, 3}, 1) == [(0, 2, 40), (1, 2, 10), (1, 2, 20), (1, 2, 30)]
+    assert ranked(index, {1, 2, 3}, 0) == [(0, 2, 40)]
+    assert ranked(index, {4}, 5) == []
+    assert index.missing_ingredients(10, {1, 2, 3}) == ['i8']
+
+
+def test_packed_key_boundary(engine):
+    # MAX_RECIPE_INGREDIENTS matched or missing is the most a key holds; ranking must stay exact there.
+    full = list(range(1, MAX_RECIPE_INGREDIENTS + 1))
+    links = [(1, ingredient_id) for ingredient_id in full] + [(2, 1), (2, 2)] + \
+        [(3, ingredient_id) for ingredient_id in range(2, MAX_RECIPE_INGREDIENTS + 2)]
+    index = PantryIndex([1, 2, 3], links, [(n, None) for n in range(1, MAX_RECIPE_INGREDIENTS + 2)])
+    assert ranked(index, set(full), 10) == [
+        (0, MAX_RECIPE_INGREDIENTS, 1), (0, 2, 2), (1, MAX_RECIPE_INGREDIENTS - 1, 3)]
+    assert ranked(index, {1}, MAX_RECIPE_INGREDIENTS) == [(1, 1, 2), (MAX_RECIPE_INGREDIENTS - 1, 1, 1)]
+    assert ranked(index, {MAX_RECIPE_INGREDIENTS + 1}, MAX_RECIPE_INGREDIENTS) == \
+        [(MAX_RECIPE_INGREDIENTS - 1, 1, 3)]
+
+
+def test_rejects_recipes_too_large_for_a_key():
+    links = [(1, ingredient_id) for ingredient_id in range(MAX_RECIPE_INGREDIENTS + 1)]
+    with pytest.raises(ValueError):
+        PantryIndex([1], links, [])
@@ -0,0 +1,76 @@
+import json
+import random
+import shutil
+
+import pytest
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+import main
+from src.dbHelper import RecipeDatabaseHandler
+from src.migrations import build_recipe_docs
+
+
+@pytest.fixture(scope='module')
+def handlers(recipe_db, tmp_path_factory):
+    docs_path = str(tmp_path_factory.mktemp('docs') / 'recipe.db')
+    shutil.copy(recipe_db, docs_path)
+    build_recipe_docs(docs_path)
+    monkeypatch = pytest.MonkeyPatch()
+    monkeypatch.setenv('QUERY_CACHE_ENABLED', '0')
+    # Both serve the same file; `live` ignores recipe_docs and runs the detail query.
+    live, docs = RecipeDatabaseHandler(docs_path), RecipeDatabaseHandler(docs_path)
+    live._has_docs = False
+    yield live, docs
+    live.pool.close()
+    docs.pool.close()
+    monkeypatch.undo()
+
+
+def client_for(handler, monkeypatch):
+    monkeypatch.setattr(main, 'db_handler_recipe', handler)
+    return TestClient(main.app)
+
+
+def test_prebuilt_docs_match_the_live_query(handlers, monkeypatch):
+    live, docs = handlers
+    recipe_ids = list(range(1, 1501, 3)) + [1500, 0, 1501, 99999]
+    served = {}
+    for handler in (live, docs):
+        client = client_for(handler, monkeypatch)
+        served[handler] = [client.get(f"/recipes/{recipe_id}") for recipe_id in recipe_ids]
+    assert docs._has_docs
+
+    for recipe_id, from_live, from_docs in zip(recipe_ids, served[live], served[docs]):
+        assert from_docs.status_code == from_live.status_code
+        assert from_docs.content == from_live.content, recipe_id
+        if from_live.status_code == 200:
+            # Byte for byte what the endpoint rendered before it served raw documents.
+            rendered = JSONResponse(main.return_format(live.get_recipe_by_id(recipe_id))).body
+            assert from_live.content == rendered
+    assert sum(response.status_code == 200 for response in served[docs]) == len(recipe_ids) - 3
+
+
+def test_batch_keeps_the_requested_order_and_reports_missing_ids(handlers, monkeypatch):
+    live, _ = handlers
+    client = client_for(live, monkeypatch)
+    rng = random.Random(3)
+    recipe_ids = rng.sample(range(1, 1501), 20)
+    requested = recipe_ids[:10] + [99999, recipe_ids[3]] + recipe_ids[10:] + [0, 99999]
+
+    for response in (client.post('/recipes/batch', json={'ids': requested}),
+                     client.get('/recipes/batch', params={'ids': requested})):
+        assert response.status_code == 200
+        batch = response.json()['response']
+        assert [recipe['id'] for recipe in batch['recipes']] == [n for n in requested if 1 <= n <= 1500]
+        assert batch['missing'] == [99999, 0]
+        for recipe in batch['recipes']:
+            assert recipe == json.loads(json.dumps(live.get_recipe_by_id(recipe['id'])))
+
+
+def test_batch_limits(handlers, monkeypatch):
+    client = client_for(handlers[0], monkeypatch)
+    assert client.post('/recipes/batch', json={'ids': []}).status_code == 400
+    too_many = list(range(1, main.recipe_batch_max + 2))
+    assert client.post('/recipes/batch', json={'ids': too_many}).status_code == 400
+    assert client.get('/recipes/batch', params={'ids': too_many[:-1]}).status_code == 200
@@ -0,0 +1,58 @@
+import re
+import shutil
+
+import pytest
+
+from src.dbHelper import RecipeDatabaseHandler
+from src.migrations import build_recipe_indexes
+
+
+@pytest.fixture(scope='module', params=['index', 'like'])
+def handler(request, recipe_db, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('indexed') / 'recipe.db')
+    shutil.copy(recipe_db, path)
+    build_recipe_indexes(path)
+    monkeypatch = pytest.MonkeyPatch()
+    monkeypatch.setenv('QUERY_CACHE_ENABLED', '0')
+    monkeypatch.setenv('RECIPE_SEARCH_ENGINE', request.param)
+    handler = RecipeDatabaseHandler(path)
+    monkeypatch.undo()
+    yield handler
+    handler.pool.close()
+
+
+def plan_tables(plan):
+    return {match.group(1) for detail in plan for match in [re.match(r"(?:SCAN|SEARCH) (\w+)", detail)] if match}
+
+
+def assert_pruned(plan):
+    # Only recipes (and the country tables behind EXISTS) are read, and nothing is grouped.
+    assert not any('GROUP BY' in detail for detail in plan), plan
+    assert not plan_tables(plan) & {'recipe_ingredients', 'ingredients', 'ri', 'i'}, plan
+
+
+@pytest.mark.parametrize('query', [None, 'chicken'])
+def test_category_filter_uses_category_index(handler, query):
+    plan = handler.explain_search(query, {'category': ['Dinner']})
+    if query is None:
+        assert any('idx_recipes_category' in detail for detail in plan), plan
+    assert_pruned(plan)
+
+
+@pytest.mark.parametrize('query', [None, 'chicken'])
+def test_country_filter_is_a_correlated_exists(handler, query):
+    plan = handler.explain_search(query, {'country': ['Italy'], 'dietType': 'Vegan'})
+    assert any(detail.startswith('CORRELATED') for detail in plan), plan
+    assert any(detail.startswith('SEARCH cr') and 'idx_countries_recipes_recipe_country' in detail
+               for detail in plan), plan
+    assert_pruned(plan)
+
+
+@pytest.mark.parametrize('filters', [
+    {},
+    {'time_max': 20, 'calories_min': 100},
+    {'category': 'Lunch', 'country': 'Japan', 'dietType': ['Keto', 'Vegan'], 'calories_max': 800}
+])
+def test_no_ingredient_joins_or_grouping(handler, filters):
+    for query in (None, 'beef', 'chicken rice'):
+        assert_pruned(handler.explain_search(query, filters))
@@ -0,0 +1,112 @@
+import json
+
+import pytest
+
+from src.dbHelper import RecipeDatabaseHandler
+from src.result_cache import ResultCache
+
+
+@pytest.fixture
+def cache_env(monkeypatch, tmp_path):
+    monkeypatch.setenv('QUERY_CACHE_ENABLED', '1')
+    monkeypatch.setenv('QUERY_CACHE_PATH', str(tmp_path / 'cache.sqlite3'))
+
+
+def make_cache(namespace='recipe', **settings):
+    cache = ResultCache(namespace)
+    for name, value in settings.items():
+        setattr(cache, name, value)
+    return cache
+
+
+def test_db_version_does_not_write_the_cache(cache_env, recipe_db, monkeypatch):
+    handler = RecipeDatabaseHandler(recipe_db)
+    monkeypatch.setattr(handler.result_cache, 'invalidate', lambda version: pytest.fail("wrote on db_version()"))
+    assert handler.db_version() is not None
+    handler.pool.close()
+
+
+def test_first_write_of_a_new_version_drops_other_versions(cache_env):
+    cache = make_cache()
+    other = make_cache('food')
+    cache.set('a', 'v1', {'n': 1})
+    other.set('a', 'v1', {'n': 1})
+
+    fresh = make_cache()
+    fresh.set('b', 'v2', {'n': 2})
+    assert fresh.get('a', 'v1') is None
+    assert fresh.get('b', 'v2') == {'n': 2}
+    assert fresh.stats()['entries'] == 1
+    # Other namespaces keep their entries.
+    assert other.get('a', 'v1') == {'n': 1}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('src.result_cache.time.time', lambda: now[0])
+    return now
+
+
+def entry_size(value):
+    return len(json.dumps(value, separators=(',', ':')).encode())
+
+
+def test_entries_expire_after_ttl(cache_env, clock):
+    cache = make_cache(ttl=10, evict_every=1000)
+    cache.set('a', 'v1', {'n': 1})
+    clock[0] = 1010
+    assert cache.get('a', 'v1') == {'n': 1}
+    clock[0] = 1010.5
+    assert cache.get('a', 'v1') is None
+    # Expired rows stay until evict() drops them.
+    assert cache.stats()['entries'] == 1
+    cache.evict()
+    assert cache.stats()['entries'] == 0
+
+
+@pytest.mark.parametrize('kept', [0, 1, 2, 4, 5])
+def test_evict_drops_least_recently_used_down_to_the_cap(cache_env, clock, kept):
+    value = {'n': 'x' * 100}
+    cache = make_cache(evict_every=1000, touch_interval=0)
+    for n in range(5):
+        clock[0] = 1000 + n
+        cache.set(f"k{n}", 'v1', value)
+    # Reading k0 makes it the most recently used.
+    clock[0] = 1010
+    assert cache.get('k0', 'v1') == value
+
+    # A cap just short of room for one more entry keeps exactly `kept` of them.
+    cache.max_bytes = entry_size(value) * (kept + 1) - 1
+    cache.evict()
+    survivors = [f"k{n}" for n in (1, 2, 3, 4, 0) if cache.get(f"k{n}", 'v1') is not None]
+    assert survivors == ['k1', 'k2', 'k3', 'k4', 'k0'][5 - kept:]
+    assert cache.stats()['bytes'] <= cache.max_bytes
+
+
+def test_evict_drops_expired_entries_before_trimming(cache_env, clock):
+    cache = make_cache(evict_every=1000, ttl=100)
+    cache.set('old', 'v1', {'n': 1})
+    cache.ttl = 1000
+    clock[0] = 1050
+    cache.set('new', 'v1', {'n': 2})
+    clock[0] = 1200
+    cache.max_bytes = entry_size({'n': 2})
+    cache.evict()
+    assert cache.get('new', 'v1') == {'n': 2}
+    assert cache.stats()['entries'] == 1
+
+
+def test_entries_of_another_version_are_misses(cache_env):
+    cache = make_cache()
+    cache.set('a', 'v1', {'n': 1})
+    assert cache.get('a', 'v2') is None
+    assert cache.get('a', 'v1') == {'n': 1}
+
+    cache.invalidate('v2')
+    assert cache.get('a', 'v1') is None
+    assert cache.stats()['entries'] == 0
+    # Writing under the version already invalidated for doesn't drop anything again.
+    cache.set('b', 'v2', {'n': 2})
+    cache.set('c', 'v2', {'n': 3})
+    assert cache.stats()['entries'] == 2
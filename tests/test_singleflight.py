@@ -0,0 +1,116 @@
+import time
+import threading
+
+import pytest
+
+from src.executor import Overloaded
+from src.singleflight import SingleFlight
+
+
+def run_threads(count, target):
+    results = [None] * count
+    errors = [None] * count
+
+    def run(n):
+        try:
+            results[n] = target(n)
+        except Exception as e:
+            errors[n] = e
+
+    threads = [threading.Thread(target=run, args=(n,)) for n in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results, errors
+
+
+def wait_for(predicate):
+    deadline = time.monotonic() + 5
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert predicate()
+
+
+def release_when_joined(flight, release, waiters):
+    # Lets the leader finish once every other caller waits on its execution.
+    def watch():
+        wait_for(lambda: flight.stats()['coalesced'] == waiters)
+        release.set()
+    threading.Thread(target=watch).start()
+
+
+def test_concurrent_identical_calls_run_once():
+    flight = SingleFlight('test', max_in_flight=0)
+    barrier = threading.Barrier(8)
+    release = threading.Event()
+    runs = []
+
+    def compute():
+        runs.append(1)
+        release.wait(5)
+        return {'rows': [1, 2, 3]}
+
+    def call(n):
+        barrier.wait()
+        return flight.do('key', compute)
+
+    release_when_joined(flight, release, 7)
+    results, errors = run_threads(8, call)
+    assert errors == [None] * 8
+    assert runs == [1]
+    assert all(result is results[0] for result in results)
+    stats = flight.stats()
+    assert (stats['executions'], stats['coalesced'], stats['in_flight']) == (1, 7, 0)
+
+
+def test_exception_reaches_every_waiter_and_clears_the_key():
+    flight = SingleFlight('test', max_in_flight=0)
+    barrier = threading.Barrier(6)
+    release = threading.Event()
+
+    def compute():
+        release.wait(5)
+        raise ValueError("boom")
+
+    def call(n):
+        barrier.wait()
+        return flight.do('key', compute)
+
+    release_when_joined(flight, release, 5)
+    results, errors = run_threads(6, call)
+    assert [type(error) for error in errors] == [ValueError] * 6
+    assert flight.stats()['in_flight'] == 0
+    # The failed execution is not remembered; the next call runs again.
+    assert flight.do('key', lambda: 'ok') == 'ok'
+
+
+def test_new_keys_are_shed_past_max_in_flight():
+    flight = SingleFlight('test', max_in_flight=2)
+    started = threading.Barrier(3)
+    release = threading.Event()
+
+    def compute(n):
+        started.wait(5)
+        release.wait(5)
+        return n
+
+    leaders = [threading.Thread(target=flight.do, args=(n, compute, n)) for n in range(2)]
+    for thread in leaders:
+        thread.start()
+    started.wait(5)
+
+    with pytest.raises(Overloaded):
+        flight.do('third', compute, 3)
+    # Joining a running execution is never refused.
+    joined = []
+    joiner = threading.Thread(target=lambda: joined.append(flight.do(0, compute, 0)))
+    joiner.start()
+    wait_for(lambda: flight.stats()['coalesced'] == 1)
+
+    release.set()
+    for thread in leaders + [joiner]:
+        thread.join(5)
+    assert joined == [0]
+    stats = flight.stats()
+    assert (stats['shed'], stats['peak_in_flight'], stats['in_flight']) == (1, 2, 0)